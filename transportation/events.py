@@ -1,11 +1,9 @@
 import frappe
+from transportation.transportation.ai_processing.utils.tracing import tracer
 
 def apply_custom_labels(doc, method=None):
     """Apply custom labels only when saving a DocType Label Config"""
-    frappe.log_error(
-        message=f"Starting label update for {doc.doctype_name}",
-        title="Label Debug"
-    )
+    tracer.debug("labels.start", doctype_name=doc.doctype_name)
     
     custom_labels = {
         d.field_name: d.custom_label 
@@ -14,10 +12,7 @@ def apply_custom_labels(doc, method=None):
     }
     
     if not custom_labels:
-        frappe.log_error(
-            message="No active custom labels found",
-            title="Label Debug"
-        )
+        tracer.debug("labels.none_active", doctype_name=doc.doctype_name)
         return
 
     try:
@@ -28,9 +23,11 @@ def apply_custom_labels(doc, method=None):
         updated = False
         for field in target_doctype.fields:
             if field.fieldname in custom_labels:
-                frappe.log_error(
-                    message=f"Updating {field.fieldname} from {field.label} to {custom_labels[field.fieldname]}",
-                    title="Label Debug"
+                tracer.debug(
+                    "labels.update_field",
+                    fieldname=field.fieldname,
+                    old_label=field.label,
+                    new_label=custom_labels[field.fieldname]
                 )
                 field.label = custom_labels[field.fieldname]
                 updated = True
@@ -38,10 +35,7 @@ def apply_custom_labels(doc, method=None):
         if updated:
             target_doctype.save()
             frappe.clear_cache()
-            frappe.log_error(
-                message="Labels updated and cache cleared",
-                title="Label Debug"
-            )
+            tracer.info("labels.updated", doctype_name=doc.doctype_name)
     
     except Exception as e:
         frappe.log_error(
@@ -52,12 +52,29 @@ add_to_apps_screen = [
 app_include_js = "transportation.bundle.js"
 app_include_css = "transportation.bundle.css"
 
+# Tolls is a custom DocType, so its on_doctype_update never runs on its own
+after_install = "transportation.transportation.doctype.tolls.tolls.on_doctype_update"
+after_migrate = "transportation.transportation.doctype.tolls.tolls.on_doctype_update"
+
+# Single doc_events mapping. hooks.py used to define doc_events twice and the
+# second definition replaced the first, so these handlers never ran. Each is
+# written as a hook for its event and now fires:
+#   Transportation Asset validate - truck limit, subbie and asset type checks
+#   Trip validate - odometer and trip checks
+#   Refuel validate / before_save - draft reminder; Expense for completed refuels
+#   Tolls before_save / after_insert - required fields; Expense for known e-tags
+#   Purchase Invoice on_submit - marks grouped trips as purchase invoiced
+# Trip Group needs no hooks: its controller runs validate and on_update itself.
+# Keep all handlers in this one dict.
 doc_events = {
     "Delivery Note Capture": {
         "after_insert": "transportation.transportation.ai_processing.chain_builder.process_delivery_note_capture"
     },
     "Transportation Asset": {
-        "validate": "transportation.transportation.doctype.transportation_asset.transportation_asset.validate"
+        "validate": "transportation.transportation.doctype.transportation_asset.transportation_asset.validate",
+        "on_update": "transportation.transportation.doctype.tolls.etag_index.invalidate",
+        "on_trash": "transportation.transportation.doctype.tolls.etag_index.invalidate",
+        "after_rename": "transportation.transportation.doctype.tolls.etag_index.invalidate"
     },
     "Trip": {
         "validate": "transportation.transportation.doctype.trip.trip.validate"
@@ -70,18 +87,30 @@ doc_events = {
         "before_save": "transportation.transportation.doctype.tolls.tolls.validate",
         "after_insert": "transportation.transportation.doctype.tolls.tolls.after_insert"
     },
-    "Trip Group": {
-        "validate": "transportation.transportation.doctype.trip_group.trip_group.validate",
-        "on_update": "transportation.transportation.doctype.trip_group.trip_group.on_update",
-        "before_delete": "transportation.transportation.doctype.trip_group.trip_group.prevent_deletion_if_invoiced"
-    },
     "Sales Invoice": {
         "on_submit": "transportation.transportation.doctype.trip_group.trip_group.handle_sales_invoice_submit"
     },
     "Purchase Invoice": {
         "on_submit": "transportation.transportation.doctype.trip_group.trip_group.handle_purchase_invoice_submit"
+    },
+    "AI Config": {
+        "on_update": "transportation.transportation.ai_processing.utils.config_cache.invalidate"
+    },
+    "ChatGPT Settings": {
+        "on_update": "transportation.transportation.ai_processing.utils.config_cache.invalidate"
+    },
+    "Claude Settings": {
+        "on_update": "transportation.transportation.ai_processing.utils.config_cache.invalidate"
+    },
+    "OCR Settings": {
+        "on_update": "transportation.transportation.ai_processing.utils.config_cache.invalidate",
+        "on_trash": "transportation.transportation.ai_processing.utils.config_cache.invalidate",
+        "after_rename": "transportation.transportation.ai_processing.utils.config_cache.invalidate"
+    },
+    "DocType Label Config": {
+        "after_insert": "transportation.events.apply_custom_labels",
+        "on_update": "transportation.events.apply_custom_labels"
     }
-
 }
 
 has_permission = {
@@ -125,12 +154,3 @@ scheduler_events = {
     }
 }
 
-doc_events = {
-    "DocType Label Config": {
-        "after_insert": "transportation.events.apply_custom_labels",
-        "on_update": "transportation.events.apply_custom_labels"
-    },
-    "Sales Invoice": {
-        "on_submit": "transportation.transportation.doctype.trip_group.trip_group.handle_sales_invoice_submit"
-    }
-}
@@ -0,0 +1,5 @@
+from transportation.transportation.doctype.tolls.tolls import on_doctype_update
+
+def execute():
+    """Tolls is a custom DocType, so migrate does not run its on_doctype_update hook"""
+    on_doctype_update()
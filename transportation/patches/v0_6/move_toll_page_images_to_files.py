@@ -0,0 +1,25 @@
+import base64
+import frappe
+from transportation.transportation.doctype.toll_page_result.section_store import save_section_image
+
+BATCH_SIZE = 100
+
+def execute():
+    """Move inline base64 Toll Page Result images into private files"""
+    while True:
+        rows = frappe.db.sql("""
+            SELECT name, base64_image
+            FROM `tabToll Page Result`
+            WHERE IFNULL(base64_image, '') != ''
+            LIMIT %s
+        """, BATCH_SIZE, as_dict=True)
+
+        if not rows:
+            break
+
+        for row in rows:
+            page_result = frappe.get_doc("Toll Page Result", row.name)
+            save_section_image(page_result, base64.b64decode(row.base64_image))
+            page_result.db_set("base64_image", None, update_modified=False)
+
+        frappe.db.commit()
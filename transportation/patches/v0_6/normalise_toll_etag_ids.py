@@ -0,0 +1,12 @@
+import frappe
+from transportation.transportation.doctype.tolls.etag_index import normalise_etag
+
+def execute():
+    """Strip whitespace from stored e-tag IDs so they match the normalised IDs new Tolls are deduped on"""
+    for etag_id in frappe.get_all("Tolls", filters={"etag_id": ["is", "set"]}, pluck="etag_id", distinct=True):
+        normalised = normalise_etag(etag_id)
+        if normalised != etag_id:
+            frappe.db.sql(
+                "update `tabTolls` set etag_id = %s where etag_id = %s",
+                (normalised, etag_id)
+            )
@@ -0,0 +1,10 @@
+import frappe
+
+# Both modes run the chain in a worker; they differ only in queue position
+RENAMED_MODES = {"Synchronous": "High Priority", "Background Job": "Normal"}
+
+def execute():
+    """Move AI Config processing_mode to the High Priority / Normal options"""
+    mode = frappe.db.get_single_value("AI Config", "processing_mode")
+    if mode in RENAMED_MODES:
+        frappe.db.set_single_value("AI Config", "processing_mode", RENAMED_MODES[mode])
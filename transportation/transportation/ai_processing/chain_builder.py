@@ -1,62 +1,153 @@
+import json
 import frappe
+from frappe.utils.background_jobs import get_queue
 from .handlers.config_handler import ConfigurationHandler
 from .handlers.document_handler import DocumentPreparationHandler
+from .handlers.image_handler import ImagePreprocessingHandler
 from .handlers.ai_handler import AIProcessingHandler
 from .handlers.response_handler import ResponseProcessingHandler
 from .utils.request import DocumentRequest
+from .utils.tracing import tracer
+from .utils.config_cache import get_config_snapshot
+
+# Handlers keep no per-document state, so one chain serves every request in the process
+_chain = None
 
 def build_processing_chain():
     """Build the complete processing chain"""
     config_handler = ConfigurationHandler()
     doc_handler = DocumentPreparationHandler()
+    image_handler = ImagePreprocessingHandler()
     ai_handler = AIProcessingHandler()
     response_handler = ResponseProcessingHandler()
     
     # Link handlers together
     config_handler.set_next(doc_handler)\
+                 .set_next(image_handler)\
                  .set_next(ai_handler)\
                  .set_next(response_handler)
     
-    # Debug the chain structure
-    current = config_handler
-    chain_str = []
-    while current:
-        chain_str.append(current.__class__.__name__)
-        current = current._next_handler
-    
-    frappe.log_error(
-        message=f"Chain structure: {' -> '.join(chain_str)}",
-        title="Chain Builder Debug"
-    )
+    if tracer.is_enabled("debug"):
+        current = config_handler
+        chain_str = []
+        while current:
+            chain_str.append(current.__class__.__name__)
+            current = current._next_handler
+        tracer.debug("chain.built", chain=" -> ".join(chain_str))
     
     return config_handler
 
+def get_processing_chain():
+    """The processing chain, built on first use"""
+    global _chain
+    if _chain is None:
+        _chain = build_processing_chain()
+    return _chain
+
 def process_delivery_note_capture(doc, method=None):
-    """Main entry point for document processing"""
-    try:
-        frappe.log_error(
-            message=f"1. Starting delivery note capture processing for doc: {doc.name}",
-            title="Process Debug"
-        )
-        
-        chain = build_processing_chain()
-        request = DocumentRequest(doc, "delivery_note_capture")
-        
-        frappe.log_error(
-            message=f"2. Created request object and chain for doc: {doc.name}",
-            title="Process Debug"
-        )
-        
-        chain.handle(request)
-        
-        frappe.log_error(
-            message=f"3. Chain handling completed for doc: {doc.name}",
-            title="Process Debug"
+    """Main entry point for document processing.
+
+    The chain always runs in a worker: it rolls back and records the failure
+    when a stage fails, which must not happen inside the upload's after_insert.
+    High Priority puts the job at the front of its queue.
+    """
+    enqueue_delivery_note_capture(doc, get_config_snapshot().ai_config)
+
+def enqueue_delivery_note_capture(doc, ai_config=None):
+    """Queue the processing chain for a Delivery Note Capture in a background worker"""
+    ai_config = ai_config or get_config_snapshot().ai_config
+
+    doc.db_set({"processing_status": "Queued", "processing_error": None}, update_modified=False)
+    frappe.enqueue(
+        "transportation.transportation.ai_processing.chain_builder.run_delivery_note_capture",
+        queue=ai_config.background_queue or "long",
+        timeout=ai_config.job_timeout or 1500,
+        job_id=f"delivery_note_capture::{doc.name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        at_front=ai_config.processing_mode != "Normal",
+        docname=doc.name
+    )
+
+def run_delivery_note_capture(docname):
+    """Background job: run (or resume) the processing chain for a Delivery Note Capture"""
+    doc = frappe.get_doc("Delivery Note Capture", docname)
+    if doc.processing_status == "Completed":
+        return
+
+    _run_delivery_note_chain(doc, resume=True)
+
+@frappe.whitelist()
+def retry_delivery_note_capture(docname):
+    """Re-queue a failed capture; the chain resumes after its last completed stage"""
+    doc = frappe.get_doc("Delivery Note Capture", docname)
+    doc.check_permission("write")
+    if doc.processing_status == "Completed":
+        frappe.throw("This delivery note has already been processed")
+
+    enqueue_delivery_note_capture(doc)
+
+@frappe.whitelist()
+def get_processing_stats(sample_size=100):
+    """Queue depth and average per-stage latency for Delivery Note Capture processing"""
+    frappe.only_for("System Manager")
+    ai_config = get_config_snapshot().ai_config
+    queue_name = ai_config.background_queue or "long"
+
+    status_counts = {
+        row.processing_status or "Not Tracked": row.count
+        for row in frappe.get_all(
+            "Delivery Note Capture",
+            fields=["processing_status", "count(name) as count"],
+            group_by="processing_status"
         )
+    }
+
+    recent = frappe.get_all(
+        "Delivery Note Capture",
+        filters={"processing_status": "Completed", "stage_timings": ["is", "set"]},
+        fields=["stage_timings"],
+        order_by="creation desc",
+        limit=frappe.utils.cint(sample_size)
+    )
+
+    totals = {}
+    for row in recent:
+        for stage, seconds in json.loads(row.stage_timings).items():
+            totals.setdefault(stage, []).append(seconds)
+
+    return {
+        "queue": queue_name,
+        "queue_depth": get_queue(queue_name).count,
+        "status_counts": status_counts,
+        "stage_latency": {
+            stage: {
+                "samples": len(values),
+                "avg_seconds": round(sum(values) / len(values), 3),
+                "max_seconds": max(values)
+            }
+            for stage, values in totals.items()
+        }
+    }
+
+def _run_delivery_note_chain(doc, resume=False):
+    """Run the chain for a document and record its final processing status"""
+    request = DocumentRequest(doc, "delivery_note_capture")
+    if resume:
+        request.restore_state()
+
+    try:
+        with tracer.trace(doc.name), tracer.span("delivery_note_capture", resume=resume):
+            chain = get_processing_chain()
+            chain.handle(request)
+            request.save_state("Completed")
         
     except Exception as e:
+        frappe.db.rollback()
+        request.error = request.error or str(e)
+        request.save_state("Failed")
         frappe.log_error(
             message=f"Delivery Note Capture Processing Failed: {str(e)}",
             title="Document Processing Error"
         )
-        raise
\ No newline at end of file
+        raise
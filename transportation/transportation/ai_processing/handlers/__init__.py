@@ -1,5 +1,6 @@
 from .base_handler import BaseHandler
 from .config_handler import ConfigurationHandler
 from .document_handler import DocumentPreparationHandler
+from .image_handler import ImagePreprocessingHandler
 from .ai_handler import AIProcessingHandler
 from .response_handler import ResponseProcessingHandler
\ No newline at end of file
@@ -2,68 +2,213 @@ from .base_handler import BaseHandler
 from ..utils.request import DocumentRequest
 from ..utils.exceptions import ProviderError
 from ..providers.provider_factory import AIProviderFactory
+from ..providers.circuit_breaker import CircuitBreaker
+from ..providers.rate_limiter import get_rate_limiter
+from ..providers import transport
+from ..utils.tracing import tracer
+from ..utils.result_cache import ResultCache
 import frappe
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Dict, List
+from frappe.utils import cint
 
 class AIProcessingHandler(BaseHandler):
+    stage = "AI Processing"
+
     def handle(self, request: DocumentRequest) -> DocumentRequest:
         try:
-            frappe.log_error(
-                message="1. Starting AI handler",
-                title="AI Handler Debug"
-            )
-            
-            # Create AI provider instance
-            provider = AIProviderFactory.create_provider(
-                request.config,
-                request.provider_settings
-            )
-            
-            frappe.log_error(
-                message="2. Created AI provider",
-                title="AI Handler Debug"
-            )
-            
+            # Resumed request: the provider already answered on a previous run
+            if request.ai_response:
+                return super().handle(request)
+
+            request.start_stage(self.stage)
+
+            # Scanned PDF: every page is extracted separately
+            if request.document_type == "pdf":
+                request.ai_response = self._process_pages(request)
+                return super().handle(request)
+
             # Process delivery note image
             if not request.base64_image:
                 raise ProviderError("No image data found for processing")
-                
-            frappe.log_error(
-                message="3. Found base64 image",
-                title="AI Handler Debug"
-            )
-                
-            # Format prompt using OCR settings
-            prompt = provider.format_prompt(
-                request.ocr_settings.language_prompt,
-                request.ocr_settings.json_example,
-                request.base64_image
-            )
-            
-            frappe.log_error(
-                message="4. Formatted prompt",
-                title="AI Handler Debug"
-            )
-            
-            # Process the document and get AI response
-            request.ai_response = provider.process_document(
-                request.base64_image,
-                prompt
-            )
-            
-            frappe.log_error(
-                message=f"5. Got AI response: {str(request.ai_response)}",
-                title="AI Handler Debug"
+
+            request.ai_response = self._extract_images(
+                request,
+                [(request.base64_image, request.image_media_type)]
+            )[0]
+
+            tracer.debug(
+                "ai.response",
+                transactions=len((request.ai_response or {}).get('transactions') or [])
             )
-            
+
             if not request.ai_response:
                 raise ProviderError("No response received from AI provider")
-            
+
             return super().handle(request)
-                
+
         except Exception as e:
             request.set_error(e)
             frappe.log_error(
                 message=f"AI handler failed: {str(e)}",
                 title="AI Handler Error"
             )
-            raise ProviderError(f"AI processing failed: {str(e)}")
\ No newline at end of file
+            raise ProviderError(f"AI processing failed: {str(e)}")
+
+    def _cache_key(self, request: DocumentRequest, base64_image: str, candidate) -> str:
+        return ResultCache.make_key(
+            base64_image,
+            candidate.family,
+            candidate.settings.default_model,
+            request.ocr_settings.language_prompt,
+            request.ocr_settings.json_example
+        )
+
+    def _candidates(self, request: DocumentRequest) -> List[frappe._dict]:
+        """Configured provider first, then the failover provider when there is one"""
+        candidates = [frappe._dict(
+            family=request.config.llm_model_family,
+            settings=request.provider_settings,
+            api_key=request.api_key
+        )]
+        if request.fallback:
+            candidates.append(request.fallback)
+        return candidates
+
+    def _create_provider(self, request: DocumentRequest, candidate, failover_available: bool):
+        provider = AIProviderFactory.create_for_family(candidate.family, candidate.settings, candidate.api_key)
+        # Delivery notes are interactive: they take precedence over bulk toll work on the same key
+        provider.limiter = get_rate_limiter(candidate.settings, candidate.api_key, "interactive")
+        # With somewhere to fail over to, give up on a struggling provider sooner
+        if failover_available:
+            provider.max_retries = min(provider.max_retries, cint(request.config.retries_before_failover))
+        return provider
+
+    def _extract_images(self, request: DocumentRequest, images: List[tuple]) -> List[Dict]:
+        """Provider responses for (base64 image, media type) pairs, in order.
+
+        Cached images are answered on this thread; the rest go to a pool capped at
+        `max_concurrent_requests` (or run on this thread when only one image is
+        left to extract), one provider instance per image because
+        providers keep per-call retry and usage state. Each image is sent to the
+        first provider whose circuit is closed; when that call fails it is retried
+        on the next one. Circuit state is read and recorded on this thread.
+        """
+        result_cache = ResultCache(request.method, request.config)
+        breaker = CircuitBreaker(request.config)
+        candidates = self._candidates(request)
+
+        responses = {}
+        pending = {}
+        for index, (base64_image, media_type) in enumerate(images):
+            cache_key = self._cache_key(request, base64_image, candidates[0])
+            cached = result_cache.get(cache_key)
+            if cached:
+                tracer.info("ai.cache_hit", image=index)
+                responses[index] = cached
+            else:
+                pending[index] = (cache_key, base64_image, media_type)
+
+        tried = {index: set() for index in pending}
+        errors = {}
+        max_workers = max(1, cint(request.provider_settings.get("max_concurrent_requests")) or 4)
+        if len(pending) > 1:
+            transport.reserve_connections(max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) if len(pending) > 1 else nullcontext() as executor:
+            while pending:
+                futures = {}
+                for index, (cache_key, base64_image, media_type) in pending.items():
+                    candidate = next(
+                        (c for c in candidates if c.family not in tried[index] and breaker.allow(c.family)),
+                        None
+                    )
+                    if not candidate:
+                        errors.setdefault(index, "no provider available (circuit open)")
+                        continue
+
+                    tried[index].add(candidate.family)
+                    provider = self._create_provider(request, candidate, len(candidates) > 1)
+                    prompt = provider.format_prompt(
+                        request.ocr_settings.language_prompt,
+                        request.ocr_settings.json_example,
+                        base64_image
+                    )
+                    future = self._submit(executor, self._timed_call, provider, base64_image, prompt, media_type)
+                    futures[future] = (index, candidate.family, provider)
+
+                retry = {}
+                for future in as_completed(futures):
+                    index, family, provider = futures[future]
+                    request.add_metrics(
+                        response_tokens=provider.response_tokens,
+                        retries=provider.retry_count
+                    )
+                    try:
+                        response, duration = future.result()
+                        breaker.record_success(family, duration)
+                        responses[index] = response
+                        errors.pop(index, None)
+                        # Only the configured provider's answers are cached: lookups use its key
+                        if family == candidates[0].family:
+                            result_cache.set(pending[index][0], response)
+                        else:
+                            tracer.warning("ai.failover", image=index, provider=family)
+                    except Exception as e:
+                        breaker.record_failure(family)
+                        errors[index] = f"{family}: {str(e)}"
+                        retry[index] = pending[index]
+                pending = retry
+
+        if errors:
+            raise ProviderError("; ".join(
+                f"image {index + 1}: {error}" if len(images) > 1 else error
+                for index, error in sorted(errors.items())
+            ))
+        return [responses[index] for index in range(len(images))]
+
+    @staticmethod
+    def _submit(executor, fn, *args) -> Future:
+        """Run on the pool, or on this thread when there is none"""
+        if executor:
+            return executor.submit(fn, *args)
+
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    @staticmethod
+    def _timed_call(provider, base64_image: str, prompt: str, media_type: str):
+        """(response, seconds taken); may run on a pool thread, so it must not touch frappe"""
+        started = time.monotonic()
+        response = provider.process_document(base64_image, prompt, media_type)
+        return response, time.monotonic() - started
+
+    def _process_pages(self, request: DocumentRequest) -> Dict:
+        """Extract every page of a PDF concurrently and merge the transactions in page order.
+
+        Extracted pages stay cached, so a retry only calls the provider for the failed ones.
+        """
+        if not request.base64_pages:
+            raise ProviderError("No page images found for processing")
+
+        pages = self._extract_images(request, request.base64_pages)
+
+        transactions = []
+        for page_number, page in enumerate(pages, start=1):
+            for transaction in (page or {}).get('transactions') or []:
+                transactions.append(dict(transaction, page=page_number))
+
+        tracer.debug(
+            "ai.pages",
+            pages=len(request.base64_pages),
+            transactions=len(transactions)
+        )
+
+        if not transactions:
+            raise ProviderError("No transactions found in the uploaded PDF")
+        return {"transactions": transactions}
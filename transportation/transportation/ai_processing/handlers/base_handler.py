@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
 from ..utils.request import DocumentRequest
-import frappe  
+from ..utils.tracing import tracer
 
 class BaseHandler(ABC):
+    stage = None  # Label recorded on the request when this handler completes
+
     def __init__(self):
         self._next_handler = None
     
@@ -14,15 +16,13 @@ class BaseHandler(ABC):
     @abstractmethod
     def handle(self, request: DocumentRequest) -> DocumentRequest:
         """Handle the request and pass to next handler if exists"""
-        # Add debug log to see if we enter the base handle method
-        frappe.log_error(
-            message=f"Base handler called for {self.__class__.__name__}",
-            title="Base Handler Debug"
-        )
+        if self.stage:
+            request.complete_stage(self.stage)
         if self._next_handler:
-            frappe.log_error(
-                message=f"Calling next handler: {self._next_handler.__class__.__name__}",
-                title="Base Handler Debug"
+            tracer.debug(
+                "chain.next_handler",
+                handler=self.__class__.__name__,
+                next_handler=self._next_handler.__class__.__name__
             )
             return self._next_handler.handle(request)
         return request
\ No newline at end of file
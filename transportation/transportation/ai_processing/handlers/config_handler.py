@@ -2,46 +2,28 @@ import frappe
 from .base_handler import BaseHandler
 from ..utils.request import DocumentRequest
 from ..utils.exceptions import ConfigurationError
+from ..utils.tracing import tracer
+from ..utils.config_cache import get_config_snapshot
 
 class ConfigurationHandler(BaseHandler):
+    stage = "Configuration"
+
     def handle(self, request: DocumentRequest) -> DocumentRequest:
         try:
-            frappe.log_error(
-                message="1. Starting config handler",
-                title="Config Handler Debug"
-            )
+            request.start_stage(self.stage)
             
-            # Load AI Config settings
-            ai_config = frappe.get_single("AI Config")
+            # Settings are served from a per-process snapshot, refreshed when any of them is saved
+            snapshot = get_config_snapshot()
+            ai_config = snapshot.ai_config
             if not ai_config.active:
                 raise ConfigurationError("AI processing is disabled in configuration")
             request.config = ai_config
+            request.provider_settings = snapshot.provider_settings
+            request.ocr_settings = snapshot.ocr_settings
+            request.api_key = snapshot.api_key
+            request.fallback = snapshot.fallback
             
-            frappe.log_error(
-                message="2. Loaded AI config",
-                title="Config Handler Debug"
-            )
-            
-            # Load provider settings
-            if ai_config.llm_model_family == "ChatGPT by OpenAI":
-                request.provider_settings = frappe.get_single("ChatGPT Settings")
-            else:
-                request.provider_settings = frappe.get_single("Claude Settings")
-            
-            frappe.log_error(
-                message=f"3. Loaded provider settings for {ai_config.llm_model_family}",
-                title="Config Handler Debug"
-            )
-            
-            # Load OCR settings
-            request.ocr_settings = frappe.get_doc("OCR Settings", {
-                "function": "Delivery Note Capture Config"
-            })
-            
-            frappe.log_error(
-                message="4. Loaded OCR settings",
-                title="Config Handler Debug"
-            )
+            tracer.debug("config.provider_settings", llm_model_family=ai_config.llm_model_family)
             
             if not request.provider_settings or not request.ocr_settings:
                 raise ConfigurationError("Required settings not found")
@@ -3,6 +3,7 @@ import frappe
 from PyPDF2 import PdfReader
 from pdf2image import convert_from_path
 import base64
+import io
 from PIL import Image
 import tempfile
 import os
@@ -10,27 +11,33 @@ from typing import List
 from ..utils.request import DocumentRequest
 from ..utils.exceptions import DocumentProcessingError
 from .base_handler import BaseHandler
+from ..utils.tracing import tracer
 
 class DocumentPreparationHandler(BaseHandler):
+    stage = "Document Preparation"
+
     def handle(self, request: DocumentRequest) -> DocumentRequest:
         """Handle document preparation synchronously"""
         try: 
-            frappe.log_error(
-                message="1. Starting document preparation",
-                title="Document Handler Debug"
-            )
+            request.start_stage(self.stage)
             
             request = self._prepare_delivery_note(request)
+            image_bytes = len(request.image_bytes or b"") + sum(map(len, request.page_images or []))
+            request.add_metrics(image_bytes=image_bytes)
             
-            frappe.log_error(
-                message="2. Document preparation completed, calling next handler",
-                title="Document Handler Debug"
+            tracer.debug(
+                "document.prepared",
+                document_type=request.document_type,
+                pages=len(request.page_images or []) or 1,
+                image_bytes=image_bytes,
+                trip=request.trip_id
             )
             
             # Call the next handler in the chain
             return super().handle(request)
                     
         except Exception as e:
+            request.fail_stage()
             frappe.log_error("Document Processing Error", str(e))
             frappe.throw(str(e))
 
@@ -43,13 +50,43 @@ class DocumentPreparationHandler(BaseHandler):
         if not os.path.exists(original_image_path):
             raise DocumentProcessingError("Delivery Note Image file not found")
         
-        with open(original_image_path, "rb") as image_file:
-            request.base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+        request.document_type = "pdf" if self._is_pdf(original_image_path) else "image"
+        
+        # A resumed request that already has an AI response does not need the image again
+        if request.ai_response is None:
+            if request.document_type == "pdf":
+                request.page_images = self._split_pdf_pages(original_image_path)
+            else:
+                with open(original_image_path, "rb") as image_file:
+                    request.image_bytes = image_file.read()
         
-        trip_doc = self._create_initial_trip(request.doc)
-        request.trip_id = trip_doc.name
+        # Trips are normally created with their final names after extraction. In placeholder
+        # mode an image gets a Processing trip up front (reused by an interrupted run's retry).
+        placeholder_mode = request.config.trip_creation == "Placeholder Before Extraction"
+        if placeholder_mode and request.document_type == "image" and not request.trip_id:
+            trip_doc = self._create_initial_trip(request.doc)
+            request.trip_id = trip_doc.name
         return request
 
+    def _is_pdf(self, file_path: str) -> bool:
+        with open(file_path, "rb") as file:
+            return file.read(5) == b"%PDF-"
+
+    def _split_pdf_pages(self, file_path: str) -> List[bytes]:
+        """Rasterise a scanned PDF one page at a time so a long stack is never held decoded in memory"""
+        page_count = len(PdfReader(file_path).pages)
+        if not page_count:
+            raise DocumentProcessingError("The uploaded PDF has no pages")
+        
+        page_images = []
+        for page_number in range(1, page_count + 1):
+            page = convert_from_path(file_path, dpi=200, first_page=page_number, last_page=page_number)[0]
+            buffer = io.BytesIO()
+            page.convert("RGB").save(buffer, format="JPEG", quality=90)
+            page.close()
+            page_images.append(buffer.getvalue())
+        return page_images
+
     def _create_initial_trip(self, source_doc):
         """Original create_initial_trip method remains unchanged"""
         try:
@@ -57,13 +94,11 @@ class DocumentPreparationHandler(BaseHandler):
             trip_doc = frappe.get_doc({
                 "doctype": "Trip",
                 "date": frappe.utils.today(),
-                "status": "Draft",
+                "status": "Processing",
                 "driver": source_doc.employee,
                 "employee_name": employee_name
             })
             trip_doc.insert(ignore_permissions=True)
-            trip_doc.status = "Processing"
-            trip_doc.save(ignore_permissions=True)
             return trip_doc
         except Exception as e:
             raise DocumentProcessingError(f"Failed to create trip document: {str(e)}")
\ No newline at end of file
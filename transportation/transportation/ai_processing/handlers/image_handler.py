@@ -0,0 +1,65 @@
+import base64
+import frappe
+from frappe.utils import cint
+from .base_handler import BaseHandler
+from ..utils.request import DocumentRequest
+from ..utils.exceptions import DocumentProcessingError
+from ..utils.image_preprocessing import preprocess_image, ensure_supported_format
+from ..utils.tracing import tracer
+
+class ImagePreprocessingHandler(BaseHandler):
+    stage = "Image Preprocessing"
+
+    def handle(self, request: DocumentRequest) -> DocumentRequest:
+        try:
+            # Resumed request: the image is not sent again
+            if request.image_bytes is None and request.page_images is None:
+                return super().handle(request)
+
+            request.start_stage(self.stage)
+
+            if request.page_images is not None:
+                request.base64_pages = []
+                for page_bytes in request.page_images:
+                    image_bytes, media_type = self._prepare_image(request, page_bytes)
+                    request.base64_pages.append((base64.b64encode(image_bytes).decode('utf-8'), media_type))
+                    request.add_metrics(image_bytes=len(image_bytes))
+                request.page_images = None
+            else:
+                image_bytes, request.image_media_type = self._prepare_image(request, request.image_bytes)
+                request.base64_image = base64.b64encode(image_bytes).decode('utf-8')
+                request.image_bytes = None
+                request.add_metrics(image_bytes=len(image_bytes))
+
+            tracer.debug(
+                "image.preprocessed",
+                final_bytes=request.stage_metrics.get("image_bytes"),
+                pages=len(request.base64_pages or []) or 1,
+                media_type=request.image_media_type
+            )
+
+            return super().handle(request)
+
+        except Exception as e:
+            request.set_error(e)
+            frappe.log_error(
+                message=f"Image preprocessing failed: {str(e)}",
+                title="Image Preprocessing Error"
+            )
+            raise DocumentProcessingError(f"Image preprocessing failed: {str(e)}")
+
+    def _prepare_image(self, request: DocumentRequest, image_bytes: bytes):
+        """(encoded bytes, media type) for one image, as configured on AI Config"""
+        config = request.config
+        if not cint(config.preprocess_images):
+            return ensure_supported_format(image_bytes, request.doc.delivery_note_image, cint(config.image_quality))
+
+        return preprocess_image(
+            image_bytes,
+            max_dimension=cint(config.image_max_dimension),
+            quality=cint(config.image_quality),
+            target_kb=cint(config.image_target_kb),
+            auto_crop=cint(config.image_auto_crop),
+            deskew=cint(config.image_deskew),
+            file_name=request.doc.delivery_note_image
+        )
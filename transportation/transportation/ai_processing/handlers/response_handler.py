@@ -1,12 +1,26 @@
 import frappe
 from frappe.utils import cint
+from frappe.model.naming import set_new_name
 from .base_handler import BaseHandler
 from ..utils.request import DocumentRequest
 from ..utils.exceptions import DocumentProcessingError
+from ..utils.tracing import tracer
+
+# Trip autoname is format:TRIP-{#############}; trips for a known truck carry its plate after the prefix
+TRIP_NAME_PREFIX = "TRIP-"
+
+def trip_name_for_plate(series_name: str, license_plate: str) -> str:
+    """TRIP-<plate>-<number>: the plate goes in after the prefix and the rest of the series name is kept whole"""
+    if not license_plate or series_name.startswith(f"{TRIP_NAME_PREFIX}{license_plate}-"):
+        return series_name
+    return f"{TRIP_NAME_PREFIX}{license_plate}-{series_name.removeprefix(TRIP_NAME_PREFIX)}"
 
 class ResponseProcessingHandler(BaseHandler):
+    stage = "Response Processing"
+
     def handle(self, request: DocumentRequest) -> DocumentRequest:
         try:
+            request.start_stage(self.stage)
             if request.method == "process_toll":
                 self._process_toll_records(request)
             else:
@@ -60,9 +74,10 @@ class ResponseProcessingHandler(BaseHandler):
 
     def _rename_trip_doc(self, doc_name: str, license_plate: str) -> str:
         """Rename the trip document to include the license plate"""
+        new_name = trip_name_for_plate(doc_name, license_plate)
+        if new_name == doc_name:
+            return doc_name
         try:
-            counter = doc_name.split('--')[-1]
-            new_name = f"TRIP-{license_plate}-{counter}"
             frappe.rename_doc("Trip", doc_name, new_name, force=True)
             return new_name
         except Exception as e:
@@ -75,92 +90,174 @@ class ResponseProcessingHandler(BaseHandler):
     def _update_documents(self, request: DocumentRequest):
         """Update ERPNext documents with AI response for delivery notes"""
         try:
-            frappe.log_error(
-                message=f"Starting response handler with AI response: {request.ai_response}",
-                title="Response Handler Debug"
-            )
+            tracer.debug("response.start", trip=request.trip_id)
 
-            # Get the first transaction from the response
             if 'transactions' in request.ai_response:
-                transaction_data = request.ai_response['transactions'][0]
+                transactions = request.ai_response['transactions']
             else:
-                transaction_data = request.ai_response  # fallback to original format
+                transactions = [request.ai_response]  # fallback to original format
+            if not transactions:
+                raise DocumentProcessingError("No transactions found in AI response")
 
-            # Get trip document
-            trip_doc = frappe.get_doc("Trip", request.trip_id)
-            
-            # Update trip fields from AI response
-            field_mappings = {
-                'date': 'date',
-                'delivery_note_number': 'delivery_note_number',
-                'odo_start': ('odo_start', lambda x: cint(x)),
-                'odo_end': ('odo_end', lambda x: cint(x)),
-                'time_start': 'time_start',
-                'time_end': 'time_end'
-            }
-
-            # Handle truck number and Transportation Asset linking first
-            if 'truck_number' in transaction_data:
-                truck_number = transaction_data['truck_number']
-                matching_truck = self._find_matching_truck(truck_number)
-                
-                if matching_truck:
-                    trip_doc.truck = matching_truck.get('name')
-                    new_name = self._rename_trip_doc(
-                        trip_doc.name, 
-                        matching_truck.get('license_plate')
-                    )
-                    trip_doc.name = new_name
-                    request.trip_id = new_name
+            self._create_trips(request, transactions)
+
+            tracer.debug("response.completed", trips=request.trip_ids)
+
+        except Exception as e:
+            frappe.log_error(
+                message=f"Failed to update documents: {str(e)}",
+                title="Response Handler Error"
+            )
+            raise DocumentProcessingError(f"Failed to update documents: {str(e)}")
+
+    def _create_trips(self, request: DocumentRequest, transactions: list):
+        """One Trip per transaction, committed together.
+
+        Each Trip is inserted once, already filled and under its final name. In
+        placeholder mode the first transaction instead fills the trip created
+        during document preparation, which is renamed and saved as before.
+        Trucks for the whole response are looked up in one query.
+        """
+        employee_name = frappe.get_value("Employee", request.doc.employee, "employee_name")
+        trucks = self._find_matching_trucks([
+            transaction['truck_number'] for transaction in transactions if transaction.get('truck_number')
+        ])
+
+        trip_ids = []
+        try:
+            for transaction_data in transactions:
+                if request.trip_id and not trip_ids:
+                    trip_doc = frappe.get_doc("Trip", request.trip_id)
+                    trip_ids.append(self._apply_transaction(trip_doc, transaction_data, trucks))
                 else:
-                    trip_doc.truck = None
-                    frappe.log_error(
-                        f"No matching Transportation Asset found for truck number: {truck_number}",
-                        "Missing Transportation Asset"
-                    )
-
-            # Handle other fields
-            for api_field, mapping in field_mappings.items():
-                if api_field in transaction_data:
-                    value = transaction_data[api_field]
-                    if isinstance(mapping, tuple):
-                        doc_field, transform_func = mapping
-                        value = transform_func(value)
-                    else:
-                        doc_field = mapping
-                    trip_doc.set(doc_field, value)
-
-            # Handle odometer readings
-            trip_doc.drop_details_odo = []
-            if 'drop_details_odo' in transaction_data:
-                for odo_reading in transaction_data['drop_details_odo']:
-                    trip_doc.append('drop_details_odo', {
-                        'odometer_reading': cint(odo_reading),
-                        'parent_trip': trip_doc.name
-                    })
+                    trip_ids.append(self._insert_trip(request.doc, employee_name, transaction_data, trucks))
+        except Exception:
+            # No partial set of trips: a retry recreates them all from the stored response
+            frappe.db.rollback()
+            raise
 
-            # Update status and save
-            trip_doc.status = 'Awaiting Approval'
-            trip_doc.save(ignore_permissions=True)
+        request.trip_ids = trip_ids
+        request.trip_id = trip_ids[0]
 
-            # Update source document if needed
-            if 'delivery_note_number' in transaction_data:
-                request.doc.delivery_note_number = transaction_data['delivery_note_number']
-                request.doc.save(ignore_permissions=True)
+        delivery_note_numbers = [
+            str(transaction['delivery_note_number'])
+            for transaction in transactions if transaction.get('delivery_note_number')
+        ]
+        values = {"trip_count": len(trip_ids)}
+        if delivery_note_numbers:
+            values["delivery_note_number"] = ", ".join(dict.fromkeys(delivery_note_numbers))[:140]
+        request.doc.db_set(values, update_modified=False)
 
-            frappe.db.commit()
+        frappe.db.commit()
 
-            frappe.log_error(
-                message="Response handler completed successfully",
-                title="Response Handler Debug"
+    def _find_matching_trucks(self, truck_numbers: list) -> dict:
+        """Trucks (name, license_plate) keyed by asset number, for every number in one query"""
+        if not truck_numbers:
+            return {}
+        try:
+            trucks = frappe.get_list(
+                "Transportation Asset",
+                filters={
+                    "asset_number": ["in", list(set(truck_numbers))],
+                    "transportation_asset_type": "Truck"
+                },
+                fields=["name", "license_plate", "asset_number"]
             )
-
+            return {truck.asset_number: truck for truck in trucks}
         except Exception as e:
             frappe.log_error(
-                message=f"Failed to update documents: {str(e)}",
-                title="Response Handler Error"
+                f"Error finding matching trucks for numbers {truck_numbers}: {str(e)}",
+                "Truck Matching Error"
             )
-            raise DocumentProcessingError(f"Failed to update documents: {str(e)}")
+            return {}
+
+    def _insert_trip(self, source_doc, employee_name: str, transaction_data: dict, trucks: dict) -> str:
+        """Insert a filled Trip named TRIP-<plate>-<n> (or the standard series when no truck matched)"""
+        try:
+            trip_doc = frappe.get_doc({
+                "doctype": "Trip",
+                "date": frappe.utils.today(),
+                "driver": source_doc.employee,
+                "employee_name": employee_name
+            })
+            # Draw the next number from the Trip series and build the final name before insert
+            set_new_name(trip_doc)
+            matching_truck = trucks.get(transaction_data.get('truck_number'))
+            if matching_truck:
+                trip_doc.name = trip_name_for_plate(trip_doc.name, matching_truck.get('license_plate'))
+
+            self._fill_trip(trip_doc, transaction_data, trucks)
+            trip_doc.status = 'Awaiting Approval'
+            trip_doc.insert(ignore_permissions=True, set_name=trip_doc.name)
+            return trip_doc.name
+
+        except Exception as e:
+            raise DocumentProcessingError(f"Failed to create trip: {str(e)}")
+
+    def _apply_transaction(self, trip_doc, transaction_data: dict, trucks: dict) -> str:
+        """Fill an existing placeholder Trip, rename it for its truck and save it; returns the trip name"""
+        try:
+            # Renamed first so the odometer rows reference the final name
+            matching_truck = trucks.get(transaction_data.get('truck_number'))
+            if matching_truck:
+                trip_doc.name = self._rename_trip_doc(
+                    trip_doc.name,
+                    matching_truck.get('license_plate')
+                )
+            self._fill_trip(trip_doc, transaction_data, trucks)
+
+            # Update status and save
+            trip_doc.status = 'Awaiting Approval'
+            trip_doc.save(ignore_permissions=True)
+            return trip_doc.name
+
+        except Exception as e:
+            raise DocumentProcessingError(f"Failed to update trip {trip_doc.name}: {str(e)}")
+
+    def _fill_trip(self, trip_doc, transaction_data: dict, trucks: dict):
+        """Set a Trip's fields from one extracted transaction"""
+        field_mappings = {
+            'date': 'date',
+            'delivery_note_number': 'delivery_note_number',
+            'odo_start': ('odo_start', lambda x: cint(x)),
+            'odo_end': ('odo_end', lambda x: cint(x)),
+            'time_start': 'time_start',
+            'time_end': 'time_end'
+        }
+
+        # Handle truck number and Transportation Asset linking first
+        if 'truck_number' in transaction_data:
+            truck_number = transaction_data['truck_number']
+            matching_truck = trucks.get(truck_number)
+            
+            if matching_truck:
+                trip_doc.truck = matching_truck.get('name')
+            else:
+                trip_doc.truck = None
+                frappe.log_error(
+                    f"No matching Transportation Asset found for truck number: {truck_number}",
+                    "Missing Transportation Asset"
+                )
+
+        # Handle other fields
+        for api_field, mapping in field_mappings.items():
+            if api_field in transaction_data:
+                value = transaction_data[api_field]
+                if isinstance(mapping, tuple):
+                    doc_field, transform_func = mapping
+                    value = transform_func(value)
+                else:
+                    doc_field = mapping
+                trip_doc.set(doc_field, value)
+
+        # Handle odometer readings
+        trip_doc.drop_details_odo = []
+        if 'drop_details_odo' in transaction_data:
+            for odo_reading in transaction_data['drop_details_odo']:
+                trip_doc.append('drop_details_odo', {
+                    'odometer_reading': cint(odo_reading),
+                    'parent_trip': trip_doc.name
+                })
 
     def _handle_error(self, request: DocumentRequest):
         """Handle errors in document processing"""
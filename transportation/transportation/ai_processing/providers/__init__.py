@@ -1,4 +1,5 @@
 from .base_provider import BaseAIProvider
 from .openai_provider import OpenAIProvider
 from .anthropic_provider import AnthropicProvider
-from .provider_factory import AIProviderFactory
\ No newline at end of file
+from .provider_factory import AIProviderFactory
+from .transport import RateLimitGate
\ No newline at end of file
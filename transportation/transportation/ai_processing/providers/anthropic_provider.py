@@ -1,21 +1,20 @@
 import json
-import requests
 from typing import Dict
 from .base_provider import BaseAIProvider
+from . import transport
 from ..utils.exceptions import ProviderError
 
 class AnthropicProvider(BaseAIProvider):
     def get_headers(self) -> Dict:
         return {
-            "x-api-key": self.settings.get_password('api_key'),
+            "x-api-key": self.api_key,
             "anthropic-version": "2023-06-01",
             "content-type": "application/json"
         }
 
-    def process_document(self, base64_image: str, prompt: str) -> Dict:
+    def process_document(self, base64_image: str, prompt: str, media_type: str = "image/jpeg") -> Dict:
         try:
             headers = self.get_headers()
-            base_url = self.settings.base_url.rstrip('/')
             
             data = {
                 "model": self.settings.default_model,
@@ -31,28 +30,30 @@ class AnthropicProvider(BaseAIProvider):
                                 "type": "image",
                                 "source": {
                                     "type": "base64",
-                                    "media_type": "image/jpeg",
+                                    "media_type": media_type,
                                     "data": base64_image
                                 }
                             }
                         ]
                     }
                 ],
-                "max_tokens": 500,
+                "max_tokens": 4096,  # Room for a sheet with several transactions
                 "temperature": float(self.settings.temperature)
             }
 
-            response = requests.post(
-                f"{base_url}/messages",
-                headers=headers,
-                json=data,
-                timeout=30
+            response = transport.post_json(
+                f"{self.base_url}/messages",
+                headers,
+                data,
+                timeout=30,
+                limiter=self.limiter
             )
 
             if response.status_code != 200:
                 raise ProviderError(f"Anthropic API error: {response.text}")
 
             result = response.json()
+            self.response_tokens = (result.get('usage') or {}).get('output_tokens', 0)
             response_text = result['content'][0]['text']
             
             # Extract JSON from response
@@ -68,5 +69,5 @@ class AnthropicProvider(BaseAIProvider):
         except Exception as e:
             if self.retry_count < self.max_retries:
                 self.retry_count += 1
-                return self.process_document(base64_image, prompt)
+                return self.process_document(base64_image, prompt, media_type)
             raise ProviderError(f"Anthropic processing failed: {str(e)}")
\ No newline at end of file
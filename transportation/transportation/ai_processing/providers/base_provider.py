@@ -1,14 +1,20 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from . import transport
 
 class BaseAIProvider(ABC):
-    def __init__(self, settings: Any):
+    def __init__(self, settings: Any, api_key: Optional[str] = None):
         self.settings = settings
+        self.api_key = api_key or settings.get_password('api_key')
+        # Resolved up front so process_document can run on a pool thread without a frappe context
+        self.base_url = transport.get_base_url(settings)
         self.max_retries = 3
         self.retry_count = 0
+        self.response_tokens = 0  # Completion tokens reported for the last response
+        self.limiter = None  # Shared rate limiter for this provider key, set by the caller
     
     @abstractmethod
-    def process_document(self, base64_image: str, prompt: str) -> Dict:
+    def process_document(self, base64_image: str, prompt: str, media_type: str = "image/jpeg") -> Dict:
         """Process document and return structured response"""
         pass
     
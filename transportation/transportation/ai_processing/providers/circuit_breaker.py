@@ -0,0 +1,67 @@
+import frappe
+from frappe.utils import cint
+from ..utils.tracing import tracer
+
+FAILURES_CACHE_KEY = "transportation:circuit_failures:"
+OPEN_CACHE_KEY = "transportation:circuit_open:"
+PROVIDER_FAMILIES = {
+    "ChatGPT by OpenAI": "ChatGPT Settings",
+    "Claude by Anthropic": "Claude Settings"
+}
+
+class CircuitBreaker:
+    """Per-provider circuit breaker shared by all workers through Redis.
+
+    Failures (errors, or calls slower than the slow-call threshold) are counted
+    in a rolling window; reaching the threshold opens the circuit for the
+    cooldown, during which `allow()` is False and callers fail over or fail
+    fast instead of waiting through retries. After the cooldown the next call
+    is a trial: one more failure reopens the circuit, a success closes it.
+    Uses frappe's cache, so it must run on a request thread.
+    """
+    def __init__(self, ai_config):
+        self.failure_threshold = cint(ai_config.circuit_failure_threshold) or 5
+        self.window = cint(ai_config.circuit_window_seconds) or 120
+        self.cooldown = cint(ai_config.circuit_cooldown_seconds) or 60
+        self.slow_call_seconds = cint(ai_config.circuit_slow_call_seconds) or 120
+
+    def allow(self, family: str) -> bool:
+        cache = frappe.cache()
+        return not cache.get(cache.make_key(OPEN_CACHE_KEY + family))
+
+    def record_success(self, family: str, duration: float) -> None:
+        if duration > self.slow_call_seconds:
+            self.record_failure(family)
+            return
+        cache = frappe.cache()
+        cache.delete(cache.make_key(FAILURES_CACHE_KEY + family))
+
+    def record_failure(self, family: str) -> None:
+        cache = frappe.cache()
+        failures_key = cache.make_key(FAILURES_CACHE_KEY + family)
+        failures = cache.incr(failures_key)
+        if failures == 1:
+            cache.expire(failures_key, self.window)
+        if failures < self.failure_threshold:
+            return
+
+        cache.set(cache.make_key(OPEN_CACHE_KEY + family), 1, ex=self.cooldown)
+        # Leave the count one short of the threshold so a failed trial call reopens at once
+        cache.set(failures_key, self.failure_threshold - 1, ex=self.window + self.cooldown)
+        tracer.warning("ai.circuit_opened", provider=family, cooldown_seconds=self.cooldown)
+
+@frappe.whitelist()
+def get_circuit_states():
+    """Open/closed state and recent failure count per provider"""
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+
+    states = {}
+    for family in PROVIDER_FAMILIES:
+        open_ttl = cache.ttl(cache.make_key(OPEN_CACHE_KEY + family))
+        states[family] = {
+            "state": "open" if open_ttl and open_ttl > 0 else "closed",
+            "reopens_in_seconds": open_ttl if open_ttl and open_ttl > 0 else None,
+            "recent_failures": cint(cache.get(cache.make_key(FAILURES_CACHE_KEY + family)))
+        }
+    return states
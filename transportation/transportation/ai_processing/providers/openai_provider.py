@@ -3,6 +3,7 @@ import time
 import requests
 from typing import Dict
 from .base_provider import BaseAIProvider
+from . import transport
 from ..utils.exceptions import ProviderError
 
 class OpenAIProvider(BaseAIProvider):
@@ -14,18 +15,20 @@ class OpenAIProvider(BaseAIProvider):
 
     def get_headers(self) -> Dict:
         return {
-            "Authorization": f"Bearer {self.settings.get_password('api_key')}",
+            "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
 
     def _make_request_with_backoff(self, url: str, headers: Dict, data: Dict) -> Dict:
         for attempt in range(self.max_retries + 1):
+            self.retry_count = attempt
             try:
-                response = requests.post(
+                response = transport.post_json(
                     url,
-                    headers=headers,
-                    json=data,
-                    timeout=(self.timeout/4, self.timeout)
+                    headers,
+                    data,
+                    timeout=(self.timeout/4, self.timeout),
+                    limiter=self.limiter
                 )
                 
                 if response.status_code == 200:
@@ -46,10 +49,9 @@ class OpenAIProvider(BaseAIProvider):
             
         raise ProviderError("Max retries exceeded")
 
-    def process_document(self, base64_image: str, prompt: str) -> Dict:
+    def process_document(self, base64_image: str, prompt: str, media_type: str = "image/jpeg") -> Dict:
         try:
             headers = self.get_headers()
-            base_url = self.settings.base_url.rstrip('/')
             
             # Modify the prompt to ensure complete JSON response
             modified_prompt = (
@@ -80,7 +82,7 @@ class OpenAIProvider(BaseAIProvider):
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                    "url": f"data:{media_type};base64,{base64_image}"
                                 }
                             }
                         ]
@@ -92,11 +94,12 @@ class OpenAIProvider(BaseAIProvider):
             }
 
             result = self._make_request_with_backoff(
-                f"{base_url}/chat/completions",
+                f"{self.base_url}/chat/completions",
                 headers,
                 data
             )
 
+            self.response_tokens = (result.get('usage') or {}).get('completion_tokens', 0)
             response_content = result['choices'][0]['message']['content']
             
             try:
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional
 from .base_provider import BaseAIProvider
 from .openai_provider import OpenAIProvider
 from .anthropic_provider import AnthropicProvider
@@ -6,11 +6,16 @@ from ..utils.exceptions import ConfigurationError
 
 class AIProviderFactory:
     @staticmethod
-    def create_provider(ai_config: Any, provider_settings: Any) -> BaseAIProvider:
+    def create_provider(ai_config: Any, provider_settings: Any, api_key: Optional[str] = None) -> BaseAIProvider:
         """Create appropriate AI provider based on configuration"""
-        if ai_config.llm_model_family == "ChatGPT by OpenAI":
-            return OpenAIProvider(provider_settings)
-        elif ai_config.llm_model_family == "Claude by Anthropic":
-            return AnthropicProvider(provider_settings)
+        return AIProviderFactory.create_for_family(ai_config.llm_model_family, provider_settings, api_key)
+
+    @staticmethod
+    def create_for_family(family: str, provider_settings: Any, api_key: Optional[str] = None) -> BaseAIProvider:
+        """Create the provider for an LLM model family, e.g. a failover target"""
+        if family == "ChatGPT by OpenAI":
+            return OpenAIProvider(provider_settings, api_key)
+        elif family == "Claude by Anthropic":
+            return AnthropicProvider(provider_settings, api_key)
         else:
-            raise ConfigurationError(f"Unknown AI provider: {ai_config.llm_model_family}")
+            raise ConfigurationError(f"Unknown AI provider: {family}")
\ No newline at end of file
@@ -0,0 +1,228 @@
+import hashlib
+from abc import ABC, abstractmethod
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+import frappe
+from frappe.utils import cint
+
+BUCKET_CACHE_KEY = "transportation:rate_limit:"
+PRIORITIES = ("interactive", "bulk")
+BULK_RESERVE = 0.2  # Share of each bucket that bulk work may not use, kept for interactive calls
+MAX_WAIT_SECONDS = 600
+IMAGE_TOKEN_ESTIMATE = 1000
+
+# Refill both buckets, then take one request and `cost` tokens or report how long to wait.
+# Bulk callers also wait while an interactive caller is queued, and may not dip into the reserve.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local reserve = tonumber(ARGV[5])
+local bulk = ARGV[6] == '1'
+
+if bulk and redis.call('EXISTS', KEYS[3]) == 1 then
+    return math.max(redis.call('PTTL', KEYS[3]), 50)
+end
+
+local function refill(key, capacity)
+    if capacity <= 0 then return 0 end
+    local data = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(data[1]) or capacity
+    local ts = tonumber(data[2]) or now
+    return math.min(capacity, level + (now - ts) * capacity / 60000)
+end
+
+local requests = refill(KEYS[1], rpm)
+local tokens = refill(KEYS[2], tpm)
+local floor = bulk and reserve or 0
+-- A bucket of one or two requests cannot keep a reserve and still grant a bulk request
+local request_floor = math.min(rpm * floor, math.max(rpm - 1, 0))
+local wait = 0
+if rpm > 0 and requests - 1 < request_floor then
+    wait = math.max(wait, (1 + request_floor - requests) * 60000 / rpm)
+end
+if tpm > 0 and tokens - cost < tpm * floor then
+    wait = math.max(wait, (cost + tpm * floor - tokens) * 60000 / tpm)
+end
+
+if wait > 0 then
+    if not bulk then
+        redis.call('SET', KEYS[3], 1, 'PX', math.ceil(wait) + 100)
+    end
+    return math.ceil(wait)
+end
+
+if rpm > 0 then
+    redis.call('HSET', KEYS[1], 'level', requests - 1, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], 120000)
+end
+if tpm > 0 then
+    redis.call('HSET', KEYS[2], 'level', tokens - cost, 'ts', now)
+    redis.call('PEXPIRE', KEYS[2], 120000)
+end
+return 0
+"""
+
+class RateLimiter(ABC):
+    """Token buckets for requests/min and tokens/min on one provider API key.
+
+    `acquire()` blocks until both buckets allow the call; `settle()` corrects
+    the token bucket once the response reports actual usage. Interactive calls
+    (delivery notes) may drain the buckets; bulk calls (toll pages) keep a
+    reserve free and stand aside while an interactive call is waiting.
+    """
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, priority: str = "interactive"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.priority = priority
+
+    def acquire(self, tokens: int = 0) -> None:
+        # A request larger than the bucket could never be granted; bulk calls may only use the part above the reserve
+        if self.tokens_per_minute:
+            reserve = BULK_RESERVE if self.priority == "bulk" else 0
+            tokens = min(tokens, int(self.tokens_per_minute * (1 - reserve)))
+        deadline = time.monotonic() + MAX_WAIT_SECONDS
+        while True:
+            wait_ms = self._take(tokens)
+            if not wait_ms:
+                return
+            if time.monotonic() + wait_ms / 1000 > deadline:
+                raise TimeoutError("Provider rate limit wait exceeded")
+            time.sleep(min(wait_ms / 1000, 5))
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        if self.tokens_per_minute and actual_tokens:
+            self._adjust(estimated_tokens - actual_tokens)
+
+    @abstractmethod
+    def _take(self, tokens: int) -> int:
+        """Take one request and `tokens` tokens, or return the milliseconds to wait first"""
+        pass
+
+    @abstractmethod
+    def _adjust(self, tokens: int) -> None:
+        """Return (or, when negative, take) tokens after a response reports its usage"""
+        pass
+
+class RedisRateLimiter(RateLimiter):
+    """Buckets shared by every worker through Redis.
+
+    Keys and the client are resolved on construction, so `acquire()` can be
+    called from pool threads that have no frappe context.
+    """
+    def __init__(self, key: str, requests_per_minute: int, tokens_per_minute: int, priority: str = "interactive"):
+        super().__init__(requests_per_minute, tokens_per_minute, priority)
+        cache = frappe.cache()
+        self._redis = cache
+        self._keys = [
+            cache.make_key(f"{BUCKET_CACHE_KEY}{key}:requests"),
+            cache.make_key(f"{BUCKET_CACHE_KEY}{key}:tokens"),
+            cache.make_key(f"{BUCKET_CACHE_KEY}{key}:interactive_waiting")
+        ]
+        self._script = cache.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def _take(self, tokens: int) -> int:
+        return cint(self._script(keys=self._keys, args=[
+            int(time.time() * 1000),
+            self.requests_per_minute,
+            self.tokens_per_minute,
+            tokens,
+            BULK_RESERVE,
+            1 if self.priority == "bulk" else 0
+        ]))
+
+    def _adjust(self, tokens: int) -> None:
+        self._redis.hincrbyfloat(self._keys[1], "level", tokens)
+
+class LocalRateLimiter(RateLimiter):
+    """In-process buckets with the same behaviour, for tests and single-worker setups"""
+    _buckets: Dict[str, Dict] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, key: str, requests_per_minute: int, tokens_per_minute: int, priority: str = "interactive"):
+        super().__init__(requests_per_minute, tokens_per_minute, priority)
+        with self._lock:
+            self._state = self._buckets.setdefault(key, {
+                "requests": float(requests_per_minute),
+                "tokens": float(tokens_per_minute),
+                "ts": time.monotonic(),
+                "interactive_waiting_until": 0.0
+            })
+
+    def _take(self, tokens: int) -> int:
+        with self._lock:
+            state = self._state
+            now = time.monotonic()
+            bulk = self.priority == "bulk"
+            if bulk and state["interactive_waiting_until"] > now:
+                return max(50, math.ceil((state["interactive_waiting_until"] - now) * 1000))
+
+            elapsed = now - state["ts"]
+            state["ts"] = now
+            if self.requests_per_minute:
+                state["requests"] = min(self.requests_per_minute, state["requests"] + elapsed * self.requests_per_minute / 60)
+            if self.tokens_per_minute:
+                state["tokens"] = min(self.tokens_per_minute, state["tokens"] + elapsed * self.tokens_per_minute / 60)
+
+            floor = BULK_RESERVE if bulk else 0
+            # A bucket of one or two requests cannot keep a reserve and still grant a bulk request
+            request_floor = min(self.requests_per_minute * floor, max(self.requests_per_minute - 1, 0))
+            wait = 0.0
+            if self.requests_per_minute and state["requests"] - 1 < request_floor:
+                wait = max(wait, (1 + request_floor - state["requests"]) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute and state["tokens"] - tokens < self.tokens_per_minute * floor:
+                wait = max(wait, (tokens + self.tokens_per_minute * floor - state["tokens"]) * 60 / self.tokens_per_minute)
+
+            if wait:
+                if not bulk:
+                    state["interactive_waiting_until"] = now + wait + 0.1
+                return math.ceil(wait * 1000)
+
+            state["requests"] -= 1
+            state["tokens"] -= tokens
+            return 0
+
+    def _adjust(self, tokens: int) -> None:
+        with self._lock:
+            self._state["tokens"] += tokens
+
+def get_rate_limiter(settings: Any, api_key: Optional[str], priority: str = "interactive") -> Optional[RateLimiter]:
+    """Limiter for a provider key, or None when the provider settings set no limits.
+
+    Buckets are keyed by a hash of the API key, so every caller sharing a key
+    (toll classification, toll extraction, delivery notes) draws from the same
+    budget. Site config `transportation_rate_limiter: "local"` keeps the
+    buckets in-process. Must be called with a frappe context.
+    """
+    requests_per_minute = cint(settings.get("requests_per_minute"))
+    tokens_per_minute = cint(settings.get("tokens_per_minute"))
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+
+    key = hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+    if frappe.conf.get("transportation_rate_limiter") == "local":
+        return LocalRateLimiter(key, requests_per_minute, tokens_per_minute, priority)
+    return RedisRateLimiter(key, requests_per_minute, tokens_per_minute, priority)
+
+def estimate_tokens(payload: Dict) -> int:
+    """Rough upper bound of the tokens a chat/messages request will consume"""
+    estimate = cint(payload.get("max_tokens"))
+    for message in payload.get("messages") or []:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "text":
+                estimate += len(part.get("text") or "") // 4
+            else:
+                estimate += IMAGE_TOKEN_ESTIMATE
+    return estimate
+
+def response_tokens(body: Dict) -> int:
+    """Total tokens reported by an OpenAI or Anthropic response body"""
+    usage = body.get("usage") or {}
+    return cint(usage.get("total_tokens")) or cint(usage.get("input_tokens")) + cint(usage.get("output_tokens"))
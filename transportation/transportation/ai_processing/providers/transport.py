@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+from .rate_limiter import RateLimiter, estimate_tokens, response_tokens
+
+DEFAULT_POOL_SIZE = 4  # Connections kept alive per host until a caller reserves more
+
+_session: Optional[requests.Session] = None
+_pool_size = 0
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Keep-alive session shared by every thread of the process.
+
+    The session outlives the thread pools that use it, so a burst of documents
+    reuses the same TLS connections. Its connection pool is thread-safe and
+    providers send no cookies, so nothing else on the session is shared state.
+    """
+    if _session is None:
+        reserve_connections(DEFAULT_POOL_SIZE)
+    return _session
+
+def reserve_connections(count: int) -> None:
+    """Grow the shared pool so `count` concurrent requests to one host each keep a connection.
+
+    Callers that fan requests out over a pool call this with their pool size
+    (the provider's `max_concurrent_requests`) before submitting.
+    """
+    global _session, _pool_size
+    with _session_lock:
+        if _session is not None and count <= _pool_size:
+            return
+        _pool_size = max(count, _pool_size, 1)
+        session = _session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+
+def get_base_url(settings: Any) -> str:
+    """Provider base URL, redirected to `ai_provider_stub_url` when it is set in site config (e.g. a local stub for load tests).
+
+    Must be called with a frappe context (i.e. not from a pool thread).
+    """
+    stub_url = frappe.conf.get("ai_provider_stub_url")
+    return (stub_url or settings.base_url).rstrip('/')
+
+def post_json(
+    url: str,
+    headers: Dict,
+    payload: Dict,
+    timeout: Union[float, tuple],
+    limiter: Optional[RateLimiter] = None
+) -> requests.Response:
+    """POST a JSON payload over the shared session. Safe to call from pool threads.
+
+    With a limiter, waits for the provider key's request and token budget first
+    and settles the token budget from the usage the response reports.
+    """
+    if not limiter:
+        return get_session().post(url, headers=headers, json=payload, timeout=timeout)
+
+    estimated_tokens = estimate_tokens(payload)
+    limiter.acquire(estimated_tokens)
+    response = get_session().post(url, headers=headers, json=payload, timeout=timeout)
+    if response.status_code == 200:
+        try:
+            limiter.settle(estimated_tokens, response_tokens(response.json()))
+        except ValueError:
+            pass
+    return response
+
+class RateLimitGate:
+    """Shared pause for pool threads once the provider answers 429.
+
+    Every thread calls `wait()` before a request; a 429 seen by any thread
+    pushes the resume time out by the response's Retry-After (or `default_delay`).
+    """
+    def __init__(self, default_delay: float = 5):
+        self.default_delay = default_delay
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, response: requests.Response) -> None:
+        try:
+            delay = float(response.headers.get("Retry-After", self.default_delay))
+        except ValueError:
+            delay = self.default_delay
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
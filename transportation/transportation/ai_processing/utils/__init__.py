@@ -1,4 +1,5 @@
 from .request import DocumentRequest
+from .tracing import tracer
 from .exceptions import (
     AIProcessingError,
     ConfigurationError,
@@ -0,0 +1,71 @@
+import frappe
+from frappe.utils import cint
+from ..providers.circuit_breaker import PROVIDER_FAMILIES
+
+VERSION_CACHE_KEY = "transportation:ai_config_version"
+
+# Per-process snapshot, rebuilt whenever the shared version changes
+_local_snapshot = {"version": None, "snapshot": None}
+
+def get_config_snapshot():
+    """AI Config, provider settings, OCR settings, API key and failover provider for the Delivery Note Capture chain.
+
+    Loaded once per process and reused until one of the settings documents is
+    saved, so processing a document costs a single Redis read instead of a
+    query per settings document.
+    """
+    cache = frappe.cache()
+    version = cache.get_value(VERSION_CACHE_KEY)
+    if version is None:
+        version = frappe.generate_hash(length=10)
+        cache.set_value(VERSION_CACHE_KEY, version)
+
+    if _local_snapshot["version"] != version:
+        _local_snapshot.update(version=version, snapshot=_build_snapshot())
+
+    return _local_snapshot["snapshot"]
+
+def invalidate(doc=None, method=None, *args):
+    """AI Config / ChatGPT Settings / Claude Settings / OCR Settings hook: drop snapshots once committed"""
+    frappe.db.after_commit.add(_clear_cache)
+
+def _clear_cache():
+    frappe.cache().delete_value(VERSION_CACHE_KEY)
+
+def _build_snapshot():
+    ai_config = frappe.get_single("AI Config")
+    if ai_config.llm_model_family == "ChatGPT by OpenAI":
+        provider_settings = frappe.get_single("ChatGPT Settings")
+    else:
+        provider_settings = frappe.get_single("Claude Settings")
+
+    ocr_settings = frappe.get_doc("OCR Settings", {
+        "function": "Delivery Note Capture Config"
+    })
+
+    return frappe._dict(
+        ai_config=ai_config,
+        provider_settings=provider_settings,
+        ocr_settings=ocr_settings,
+        api_key=provider_settings.get_password("api_key", raise_exception=False),
+        fallback=_build_fallback(ai_config)
+    )
+
+def _build_fallback(ai_config):
+    """The other provider family, when failover is enabled and that provider is configured"""
+    if not cint(ai_config.enable_failover):
+        return None
+
+    family = next(
+        (family for family in PROVIDER_FAMILIES if family != ai_config.llm_model_family),
+        None
+    )
+    if not family:
+        return None
+
+    settings = frappe.get_single(PROVIDER_FAMILIES[family])
+    api_key = settings.get_password("api_key", raise_exception=False)
+    if not api_key or not settings.default_model:
+        return None
+
+    return frappe._dict(family=family, settings=settings, api_key=api_key)
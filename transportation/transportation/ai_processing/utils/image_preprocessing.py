@@ -0,0 +1,146 @@
+import io
+import mimetypes
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image, ImageOps
+
+try:
+    import cv2
+except ImportError:  # Deskew and crop need OpenCV; resizing and recompression do not
+    cv2 = None
+
+# Formats every provider accepts as-is
+PASSTHROUGH_MEDIA_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+MIN_JPEG_QUALITY = 50
+EXIF_ORIENTATION = 0x0112
+MAX_DESKEW_DEGREES = 15
+
+def ensure_supported_format(image_bytes: bytes, file_name: Optional[str] = None, quality: int = 85) -> Tuple[bytes, str]:
+    """The image with a media type every provider accepts.
+
+    JPEG, PNG, WebP and GIF are returned as-is. Anything else Pillow can read
+    (MPO from phone cameras, TIFF, BMP, ...) is re-encoded as JPEG, upright.
+    Undecodable bytes are returned untouched under the type their file name
+    suggests, or JPEG when that is not a supported one.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        original_format = image.format
+        if original_format in PASSTHROUGH_MEDIA_TYPES:
+            return image_bytes, PASSTHROUGH_MEDIA_TYPES[original_format]
+        image.load()
+    except Exception:
+        return image_bytes, _guess_media_type(file_name)
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return _encode_jpeg(image, quality, 0), "image/jpeg"
+
+def preprocess_image(
+    image_bytes: bytes,
+    max_dimension: int = 2048,
+    quality: int = 85,
+    target_kb: int = 0,
+    auto_crop: bool = True,
+    deskew: bool = True,
+    file_name: Optional[str] = None
+) -> Tuple[bytes, str]:
+    """Orient, straighten, crop and shrink a document photo for submission to a vision model.
+
+    Returns the encoded image and its media type. The original is returned
+    untouched when it cannot be decoded, or when it is already a supported
+    format, within max_dimension and no larger than the re-encoded result.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        original_format = image.format
+        image.load()
+    except Exception:
+        return image_bytes, _guess_media_type(file_name)
+
+    changed = image.getexif().get(EXIF_ORIENTATION, 1) != 1
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    if cv2 is not None and (auto_crop or deskew):
+        original = pixels = np.array(image)
+        # Crop first so the background does not skew the text angle estimate
+        if auto_crop:
+            pixels = _crop_to_document(pixels)
+        if deskew:
+            pixels = _deskew(pixels)
+        if pixels is not original:
+            changed = True
+            image = Image.fromarray(pixels)
+
+    if max_dimension and max(image.size) > max_dimension:
+        changed = True
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    encoded = _encode_jpeg(image, quality, target_kb)
+
+    if original_format in PASSTHROUGH_MEDIA_TYPES and not changed and len(image_bytes) <= len(encoded):
+        return image_bytes, PASSTHROUGH_MEDIA_TYPES[original_format]
+    return encoded, "image/jpeg"
+
+def _guess_media_type(file_name: Optional[str]) -> str:
+    """Supported media type suggested by the file name, JPEG otherwise"""
+    guessed = file_name and mimetypes.guess_type(file_name)[0]
+    return guessed if guessed in PASSTHROUGH_MEDIA_TYPES.values() else "image/jpeg"
+
+def _encode_jpeg(image: Image.Image, quality: int, target_kb: int) -> bytes:
+    """Encode at the configured quality, stepping down until the target size is met"""
+    quality = max(MIN_JPEG_QUALITY, min(95, quality or 85))
+    while True:
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        if not target_kb or buffer.tell() <= target_kb * 1024 or quality <= MIN_JPEG_QUALITY:
+            return buffer.getvalue()
+        quality = max(MIN_JPEG_QUALITY, quality - 10)
+
+def _deskew(pixels: np.ndarray) -> np.ndarray:
+    """Rotate so text lines run horizontally; small angles only, larger ones are left to EXIF"""
+    gray = cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    coords = np.column_stack(np.where(ink > 0))
+    if len(coords) < 100:
+        return pixels
+
+    angle = cv2.minAreaRect(coords.astype(np.float32))[-1]
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    if abs(angle) < 0.5 or abs(angle) > MAX_DESKEW_DEGREES:
+        return pixels
+
+    height, width = gray.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), -angle, 1.0)
+    return cv2.warpAffine(
+        pixels, matrix, (width, height),
+        flags=cv2.INTER_CUBIC,
+        borderMode=cv2.BORDER_REPLICATE
+    )
+
+def _crop_to_document(pixels: np.ndarray) -> np.ndarray:
+    """Crop to the largest bright region (the paper) when it clearly stands out from the background"""
+    gray = cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, paper = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(paper, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return pixels
+
+    x, y, width, height = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    image_height, image_width = gray.shape
+    area_ratio = (width * height) / float(image_width * image_height)
+    # Too small is probably a label on the page, too large means there is no background to remove
+    if area_ratio < 0.2 or area_ratio > 0.95:
+        return pixels
+
+    margin = int(0.01 * max(image_width, image_height))
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(image_width, x + width + margin), min(image_height, y + height + margin)
+    return pixels[y0:y1, x0:x1]
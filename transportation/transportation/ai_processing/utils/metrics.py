@@ -0,0 +1,115 @@
+import frappe
+from typing import Dict, Optional
+from werkzeug.wrappers import Response
+
+METRICS_CACHE_KEY = "transportation:handler_metrics"
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)  # seconds
+SIZE_METRICS = ("image_bytes", "response_tokens", "retries")
+
+def record_handler(
+    document_type: str,
+    handler: str,
+    outcome: str,
+    duration: Optional[float],
+    sizes: Optional[Dict[str, int]] = None
+) -> None:
+    """Add one handler execution to the shared Redis aggregates"""
+    sizes = sizes or {}
+    prefix = f"{document_type}|{handler}"
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    key = cache.make_key(METRICS_CACHE_KEY)
+
+    pipe.hincrby(key, f"{prefix}|count|{outcome}", 1)
+    if duration is not None:
+        pipe.hincrbyfloat(key, f"{prefix}|duration_sum", duration)
+        bucket = next((str(b) for b in DURATION_BUCKETS if duration <= b), "+Inf")
+        pipe.hincrby(key, f"{prefix}|bucket|{bucket}", 1)
+    for metric in SIZE_METRICS:
+        if sizes.get(metric):
+            pipe.hincrby(key, f"{prefix}|{metric}", int(sizes[metric]))
+
+    pipe.execute()
+
+def get_aggregates() -> Dict[tuple, Dict]:
+    """Aggregates keyed by (document_type, handler)"""
+    aggregates = {}
+    for field, value in _read_counters().items():
+        document_type, handler, metric, *label = frappe.safe_decode(field).split("|")
+        entry = aggregates.setdefault((document_type, handler), {"count": {}, "bucket": {}})
+        value = float(value)
+        if label:
+            entry[metric][label[0]] = value
+        else:
+            entry[metric] = value
+    return aggregates
+
+def _read_counters() -> Dict[bytes, bytes]:
+    """Raw counter hash as written by record_handler.
+
+    Read with the plain Redis client under cache.make_key: RedisWrapper.hgetall
+    would prefix the already prefixed key again and try to unpickle the
+    integer and float counters that hincrby writes.
+    """
+    cache = frappe.cache()
+    return dict(cache.hscan_iter(cache.make_key(METRICS_CACHE_KEY)))
+
+@frappe.whitelist()
+def get_handler_metrics():
+    """Per handler, per document type: executions by outcome, latency and payload totals"""
+    frappe.only_for("System Manager")
+
+    result = []
+    for (document_type, handler), entry in sorted(get_aggregates().items()):
+        total = sum(entry["count"].values())
+        result.append({
+            "document_type": document_type,
+            "handler": handler,
+            "executions": int(total),
+            "outcomes": {outcome: int(count) for outcome, count in entry["count"].items()},
+            "avg_seconds": round(entry.get("duration_sum", 0) / total, 3) if total else None,
+            **{metric: int(entry.get(metric, 0)) for metric in SIZE_METRICS}
+        })
+    return result
+
+@frappe.whitelist()
+def prometheus_metrics():
+    """Handler aggregates in Prometheus text exposition format"""
+    frappe.only_for("System Manager")
+
+    lines = [
+        "# HELP transportation_handler_executions_total Processing chain handler executions",
+        "# TYPE transportation_handler_executions_total counter",
+    ]
+    aggregates = sorted(get_aggregates().items())
+
+    for (document_type, handler), entry in aggregates:
+        for outcome, count in entry["count"].items():
+            lines.append(
+                f'transportation_handler_executions_total{{document_type="{document_type}",'
+                f'handler="{handler}",outcome="{outcome}"}} {int(count)}'
+            )
+
+    lines += [
+        "# HELP transportation_handler_duration_seconds Handler wall time",
+        "# TYPE transportation_handler_duration_seconds histogram",
+    ]
+    for (document_type, handler), entry in aggregates:
+        labels = f'document_type="{document_type}",handler="{handler}"'
+        cumulative = 0
+        for bucket in [str(b) for b in DURATION_BUCKETS] + ["+Inf"]:
+            cumulative += entry["bucket"].get(bucket, 0)
+            lines.append(f'transportation_handler_duration_seconds_bucket{{{labels},le="{bucket}"}} {int(cumulative)}')
+        lines.append(f"transportation_handler_duration_seconds_sum{{{labels}}} {entry.get('duration_sum', 0)}")
+        lines.append(f"transportation_handler_duration_seconds_count{{{labels}}} {int(cumulative)}")
+
+    for metric in SIZE_METRICS:
+        lines += [f"# TYPE transportation_handler_{metric}_total counter"]
+        for (document_type, handler), entry in aggregates:
+            if metric in entry:
+                lines.append(
+                    f'transportation_handler_{metric}_total{{document_type="{document_type}",'
+                    f'handler="{handler}"}} {int(entry[metric])}'
+                )
+
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
@@ -1,5 +1,9 @@
+import json
+import time
 import frappe
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Tuple
+from .tracing import tracer
+from . import metrics
 
 class DocumentRequest:
     def __init__(self, doc: Any, method: str):
@@ -7,18 +11,106 @@ class DocumentRequest:
         self.method = method              # Method being called
         self.config: Optional[Dict] = None  # AI Config settings
         self.provider_settings = None      # ChatGPT or Claude settings
+        self.api_key: Optional[str] = None  # Provider API key from the config snapshot
+        self.fallback = None              # Failover provider (family, settings, api_key), if configured
         self.ocr_settings = None          # Document-specific OCR settings
+        self.image_bytes: Optional[bytes] = None  # Uploaded image, before preprocessing
         self.base64_image: Optional[str] = None  # Base64 encoded image
+        self.image_media_type: str = "image/jpeg"  # Media type of base64_image
+        self.page_images: Optional[List[bytes]] = None  # Rendered pages of an uploaded PDF
+        self.base64_pages: Optional[List[Tuple[str, str]]] = None  # (base64 image, media type) per PDF page
         self.base64_document: Optional[str] = None  # Base64 encoded PDF
         self.document_type: Optional[str] = None  # 'image' or 'pdf'
         self.ai_response = None           # Response from AI provider
         self.processed_data = None        # Final processed data
         self.error = None                 # Any error information
         self.trip_id = None               # Created trip document ID
+        self.trip_ids: List[str] = []     # Every trip created from a multi-page document
+        self.completed_stage: Optional[str] = None  # Last handler stage that finished
+        self.stage_timings: Dict[str, float] = {}  # Seconds spent in each stage
+        self.track_state = method == "delivery_note_capture"  # Persist progress on the source doc
+        self.stage_metrics: Dict[str, int] = {}  # Payload sizes and retries of the running stage
+        self._stage_started: Optional[float] = None
+        self._current_stage: Optional[str] = None
 
     def set_error(self, error: Exception) -> None:
         self.error = str(error)
+        self.fail_stage()
         frappe.log_error(
             message=f"Document Processing Error: {str(error)}", 
             title="AI Processing Error"
         )
+
+    def restore_state(self) -> None:
+        """Reload progress persisted by an earlier run so the chain can resume"""
+        if not self.track_state:
+            return
+
+        self.trip_id = self.doc.get("trip") or None
+        self.completed_stage = self.doc.get("processing_stage") or None
+        if self.doc.get("ai_response"):
+            self.ai_response = json.loads(self.doc.ai_response)
+        if self.doc.get("stage_timings"):
+            self.stage_timings = json.loads(self.doc.stage_timings)
+
+    def start_stage(self, stage: str) -> None:
+        """Mark the start of a handler stage"""
+        self._stage_started = time.monotonic()
+        self._current_stage = stage
+        self.stage_metrics = {}
+
+    def fail_stage(self) -> None:
+        """Count the running stage as failed.
+
+        Only the stage that raised is still open; outer handlers re-raising
+        have already completed theirs, so each failure is counted once.
+        """
+        if self._stage_started is not None:
+            self._record_metrics(self._current_stage, "error", time.monotonic() - self._stage_started)
+            self._stage_started = None
+
+    def add_metrics(self, **sizes: int) -> None:
+        """Attach payload sizes (image_bytes, response_tokens, retries) to the running stage"""
+        for metric, value in sizes.items():
+            self.stage_metrics[metric] = self.stage_metrics.get(metric, 0) + (value or 0)
+
+    def complete_stage(self, stage: str) -> None:
+        """Record the time spent in a stage and checkpoint progress"""
+        if self._stage_started is not None:
+            self.stage_timings[stage] = round(time.monotonic() - self._stage_started, 3)
+            self._stage_started = None
+            tracer.info(
+                "chain.stage",
+                stage=stage,
+                method=self.method,
+                duration_ms=round(self.stage_timings[stage] * 1000, 2)
+            )
+            self._record_metrics(stage, "ok", self.stage_timings[stage])
+        self.completed_stage = stage
+        self.save_state("Processing")
+
+    def save_state(self, status: Optional[str] = None) -> None:
+        """Persist the chain's progress on the source document and commit it"""
+        if not self.track_state:
+            return
+
+        values = {
+            "processing_stage": self.completed_stage,
+            "trip": self.trip_id,
+            "ai_response": json.dumps(self.ai_response) if self.ai_response else None,
+            "stage_timings": json.dumps(self.stage_timings),
+            "processing_error": self.error
+        }
+        if status:
+            values["processing_status"] = status
+
+        self.doc.db_set(values, update_modified=False)
+        frappe.db.commit()
+
+    def _record_metrics(self, stage: str, outcome: str, duration: float) -> None:
+        try:
+            metrics.record_handler(self.method, stage, outcome, duration, self.stage_metrics)
+        except Exception as e:
+            # Metrics are best effort and must never fail a document
+            tracer.warning("metrics.record_failed", stage=stage, error=str(e))
+        self.stage_metrics = {}
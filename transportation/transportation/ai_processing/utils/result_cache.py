@@ -0,0 +1,86 @@
+import hashlib
+import time
+import frappe
+from frappe.utils import cint
+
+ENTRY_CACHE_PREFIX = "transportation:ai_result:"
+INDEX_CACHE_KEY = "transportation:ai_result_index"
+STATS_CACHE_KEY = "transportation:ai_result_stats"
+
+class ResultCache:
+    """Content-addressed store of parsed AI responses.
+
+    Keys hash the image together with everything else that shapes the answer
+    (prompt, model, JSON example), so a re-uploaded document with unchanged
+    settings is answered from Redis instead of a vision call. Entries expire
+    after the configured TTL and the oldest are evicted beyond the configured
+    number of entries. Uses frappe's cache, so it must run on a request thread.
+    """
+    def __init__(self, namespace: str, ai_config):
+        self.namespace = namespace
+        self.enabled = bool(cint(ai_config.result_cache_enabled))
+        self.ttl = cint(ai_config.result_cache_ttl_hours) * 3600 or None
+        self.max_entries = cint(ai_config.result_cache_max_entries)
+
+    @staticmethod
+    def make_key(image, *parts) -> str:
+        digest = hashlib.sha256(image.encode() if isinstance(image, str) else image)
+        for part in parts:
+            digest.update(b"\0" + str(part or "").encode())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+
+        cache = frappe.cache()
+        value = cache.get_value(ENTRY_CACHE_PREFIX + key)
+        outcome = "hits" if value is not None else "misses"
+        cache.hincrby(cache.make_key(STATS_CACHE_KEY), f"{self.namespace}|{outcome}", 1)
+        return value
+
+    def set(self, key: str, value) -> None:
+        if not self.enabled or value is None:
+            return
+
+        cache = frappe.cache()
+        cache.set_value(ENTRY_CACHE_PREFIX + key, value, expires_in_sec=self.ttl)
+
+        index = cache.make_key(INDEX_CACHE_KEY)
+        now = time.time()
+        cache.zadd(index, {key: now})
+        if self.ttl:
+            cache.zremrangebyscore(index, 0, now - self.ttl)
+        overflow = cache.zcard(index) - self.max_entries if self.max_entries else 0
+        if overflow > 0:
+            evicted = [frappe.safe_decode(member) for member, _ in cache.zpopmin(index, overflow)]
+            cache.delete_value([ENTRY_CACHE_PREFIX + member for member in evicted])
+
+@frappe.whitelist()
+def get_result_cache_stats():
+    """Hits, misses and hit rate per cache namespace, with the number of stored entries"""
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+
+    stats = {}
+    for field, count in cache.hscan_iter(cache.make_key(STATS_CACHE_KEY)):
+        namespace, outcome = frappe.safe_decode(field).split("|")
+        stats.setdefault(namespace, {"hits": 0, "misses": 0})[outcome] = cint(count)
+
+    for counts in stats.values():
+        lookups = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = round(counts["hits"] / lookups, 3) if lookups else None
+
+    return {"entries": cache.zcard(cache.make_key(INDEX_CACHE_KEY)), "namespaces": stats}
+
+@frappe.whitelist()
+def clear_result_cache():
+    """Drop every cached AI response and reset the statistics"""
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+    index = cache.make_key(INDEX_CACHE_KEY)
+
+    members = [frappe.safe_decode(member) for member in cache.zrange(index, 0, -1)]
+    if members:
+        cache.delete_value([ENTRY_CACHE_PREFIX + member for member in members])
+    cache.delete(index, cache.make_key(STATS_CACHE_KEY))
@@ -0,0 +1,141 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import frappe
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "off": 100}
+
+class MemorySink:
+    """Ring buffer of the most recent trace records in this process"""
+    def __init__(self, maxlen: int = 1000):
+        self._records = deque(maxlen=maxlen)
+
+    def write(self, record: Dict) -> None:
+        self._records.append(record)
+
+    def records(self, limit: Optional[int] = None) -> List[Dict]:
+        records = list(self._records)
+        return records[-limit:] if limit else records
+
+    def clear(self) -> None:
+        self._records.clear()
+
+class FileSink:
+    """JSON lines in the site's logs/transportation_trace.log (rotated by frappe's logger)"""
+    def write(self, record: Dict) -> None:
+        frappe.logger("transportation_trace", allow_site=True, file_count=5).info(
+            json.dumps(record, default=str)
+        )
+
+class Tracer:
+    """Structured, levelled tracing for the AI and toll pipelines.
+
+    Replaces "Debug" Error Log entries, which cost a database insert each.
+    Configured from site config:
+
+        transportation_trace_level        debug | info | warning | error | off (default: info)
+        transportation_trace_sample_rate  fraction of traces kept, 0-1 (default: 1)
+        transportation_trace_sink         file | memory | both (default: file)
+
+    Sampling is decided once per `trace()` so a kept document keeps all its
+    records; errors are always written.
+    """
+    def __init__(self):
+        self.memory = MemorySink()
+        self.file = FileSink()
+        self._context = threading.local()
+
+    def _setting(self, key: str, default):
+        try:
+            return frappe.conf.get(key, default)
+        except RuntimeError:  # no frappe context, e.g. on a pool thread
+            return default
+
+    def is_enabled(self, level: str) -> bool:
+        threshold = LEVELS.get(self._setting("transportation_trace_level", "info"), LEVELS["info"])
+        if LEVELS[level] < threshold:
+            return False
+        if level == "error":
+            return True
+        sampled = getattr(self._context, "sampled", None)
+        if sampled is None:
+            sampled = self._sample()
+        return sampled
+
+    def _sample(self) -> bool:
+        rate = float(self._setting("transportation_trace_sample_rate", 1))
+        return rate >= 1 or random.random() < rate
+
+    @contextmanager
+    def trace(self, trace_id: str):
+        """Group the records emitted inside the block under one trace id and sampling decision"""
+        previous = (getattr(self._context, "trace_id", None), getattr(self._context, "sampled", None))
+        self._context.trace_id = trace_id
+        self._context.sampled = self._sample()
+        try:
+            yield
+        finally:
+            self._context.trace_id, self._context.sampled = previous
+
+    @contextmanager
+    def span(self, name: str, level: str = "info", **fields):
+        """Time a block and emit one record with its duration and outcome.
+
+        Yields a dict; keys added to it are included in the record.
+        """
+        extra = {}
+        started = time.monotonic()
+        try:
+            yield extra
+        except Exception as e:
+            self.emit("error", name, duration_ms=self._elapsed_ms(started), outcome="error",
+                      error=str(e), **fields, **extra)
+            raise
+        self.emit(level, name, duration_ms=self._elapsed_ms(started), outcome="ok", **fields, **extra)
+
+    def debug(self, event: str, **fields) -> None:
+        self.emit("debug", event, **fields)
+
+    def info(self, event: str, **fields) -> None:
+        self.emit("info", event, **fields)
+
+    def warning(self, event: str, **fields) -> None:
+        self.emit("warning", event, **fields)
+
+    def error(self, event: str, **fields) -> None:
+        self.emit("error", event, **fields)
+
+    def emit(self, level: str, event: str, **fields) -> None:
+        if not self.is_enabled(level):
+            return
+
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "level": level,
+            "event": event,
+            "trace_id": getattr(self._context, "trace_id", None),
+            **fields
+        }
+
+        sink = self._setting("transportation_trace_sink", "file")
+        if sink in ("memory", "both"):
+            self.memory.write(record)
+        if sink in ("file", "both"):
+            self.file.write(record)
+
+    @staticmethod
+    def _elapsed_ms(started: float) -> float:
+        return round((time.monotonic() - started) * 1000, 2)
+
+tracer = Tracer()
+
+@frappe.whitelist()
+def get_recent_traces(limit=200):
+    """Records held by this worker's in-memory sink"""
+    frappe.only_for("System Manager")
+    return tracer.memory.records(frappe.utils.cint(limit))
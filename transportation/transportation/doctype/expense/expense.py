@@ -8,7 +8,7 @@ class Expense(Document):
     
     def validate_reference(self):
         """Validate that the correct reference field is filled based on expense type"""
-        if self.expense_type == "Toll" and not self.toll_reference:
+        if self.expense_type == "Toll" and not self.tolls_reference:
             frappe.throw(_("Toll Reference is required for Toll expense type"))
         elif self.expense_type == "Refuel" and not self.refuel_reference:
             frappe.throw(_("Refuel Reference is required for Refuel expense type"))
@@ -0,0 +1,38 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import now_datetime, today
+
+class TestExpense(FrappeTestCase):
+    def _expense(self, **fields):
+        return frappe.get_doc(dict(
+            doctype="Expense",
+            expense_type="Toll",
+            license_plate="TESTPLATE",
+            expense_date=today(),
+            expense_cost=10,
+            **fields
+        ))
+
+    def test_reference_fields_exist(self):
+        meta = frappe.get_meta("Expense")
+        for fieldname in ("tolls_reference", "refuel_reference", "maintenance_reference"):
+            self.assertTrue(meta.has_field(fieldname), fieldname)
+
+    def test_toll_expense_requires_tolls_reference(self):
+        self.assertRaises(frappe.ValidationError, self._expense().insert)
+
+    def test_toll_expense_with_tolls_reference_saves(self):
+        toll = frappe.get_doc({
+            "doctype": "Tolls",
+            "transaction_date": now_datetime(),
+            "tolling_point": "TEST PLAZA",
+            "etag_id": "TESTEXPENSE01",
+            "net_amount": 10,
+            "process_status": "Unprocessed"
+        })
+        toll.flags.skip_expense_creation = True
+        toll.insert()
+
+        expense = self._expense(tolls_reference=toll.name).insert()
+
+        self.assertEqual(frappe.db.get_value("Expense", expense.name, "tolls_reference"), toll.name)
@@ -0,0 +1,101 @@
+import io
+from typing import Dict, Optional, Tuple
+import frappe
+import numpy as np
+from frappe.utils import flt
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:  # Header template matching needs OpenCV; the line and text measures do not
+    cv2 = None
+
+VALID = "valid"
+EMPTY = "empty"
+AMBIGUOUS = "ambiguous"
+
+ANALYSIS_WIDTH = 800
+INK_LEVEL = 160  # Grey level below which a pixel counts as ink
+BLANK_INK_RATIO = 0.003
+RULE_FILL = 0.4  # Share of a row (or table column) that must be ink for it to be a ruling line
+MIN_TABLE_RULES = 6
+MIN_TABLE_COLUMNS = 3
+MIN_TEXT_ROWS = 5
+
+class PageClassifier:
+    """Decides on rendered toll statement pages without calling the model.
+
+    Measures ink density, ruled table lines and text rows with numpy, and,
+    when a header template is configured and OpenCV is available, matches the
+    transaction table header. Only pages with almost no ink are "empty";
+    pages that match the header or carry a ruled grid with text rows are
+    "valid"; anything else, including sparse pages with a few lines of text,
+    is "ambiguous" and left to the model. Build on the request thread; `classify()` itself does not use frappe.
+    """
+    def __init__(self, toll_settings):
+        self.header_threshold = flt(toll_settings.header_match_threshold) or 0.8
+        self.header_template = self._load_template(toll_settings.header_template)
+
+    def classify(self, image: Image.Image) -> Tuple[str, Dict]:
+        """(verdict, measurements) for a rendered page"""
+        scale = ANALYSIS_WIDTH / float(image.width)
+        gray = image.convert("L").resize((ANALYSIS_WIDTH, max(1, round(image.height * scale))))
+        pixels = np.asarray(gray)
+        ink = pixels < INK_LEVEL
+        row_fill = ink.mean(axis=1)
+
+        scores = {
+            "ink_ratio": round(float(ink.mean()), 4),
+            "rules": self._count_runs(row_fill >= RULE_FILL),
+            "columns": self._count_columns(ink, row_fill),
+            "text_rows": self._count_runs((row_fill > 0.01) & (row_fill < RULE_FILL))
+        }
+
+        if self.header_template is not None:
+            scores["header_match"] = self._match_header(pixels, scale)
+            if scores["header_match"] >= self.header_threshold:
+                return VALID, scores
+
+        if scores["ink_ratio"] < BLANK_INK_RATIO:
+            return EMPTY, scores
+        if (
+            scores["rules"] >= MIN_TABLE_RULES
+            and scores["columns"] >= MIN_TABLE_COLUMNS
+            and scores["text_rows"] >= MIN_TEXT_ROWS
+        ):
+            return VALID, scores
+        return AMBIGUOUS, scores
+
+    @staticmethod
+    def _count_runs(mask: np.ndarray) -> int:
+        """Number of separate runs of True, so a thick line or text row counts once"""
+        return int(np.count_nonzero(mask[1:] & ~mask[:-1]) + bool(mask[0])) if len(mask) else 0
+
+    def _count_columns(self, ink: np.ndarray, row_fill: np.ndarray) -> int:
+        """Vertical ruling lines within the band spanned by the horizontal rules"""
+        rule_rows = np.flatnonzero(row_fill >= RULE_FILL)
+        if len(rule_rows) < 2:
+            return 0
+        table = ink[rule_rows[0]:rule_rows[-1] + 1]
+        return self._count_runs(table.mean(axis=0) >= RULE_FILL)
+
+    def _match_header(self, pixels: np.ndarray, scale: float) -> float:
+        template = self.header_template
+        if scale != 1:
+            template = cv2.resize(template, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if template.shape[0] > pixels.shape[0] or template.shape[1] > pixels.shape[1] or min(template.shape) < 4:
+            return 0.0
+        result = cv2.matchTemplate(pixels, template, cv2.TM_CCOEFF_NORMED)
+        return round(float(result.max()), 3)
+
+    @staticmethod
+    def _load_template(file_url: Optional[str]) -> Optional[np.ndarray]:
+        if not file_url or cv2 is None:
+            return None
+        try:
+            content = frappe.get_doc("File", {"file_url": file_url}).get_content()
+            with Image.open(io.BytesIO(content)) as template:
+                return np.asarray(template.convert("L"))
+        except Exception as e:
+            frappe.log_error(f"Could not load toll header template {file_url}: {str(e)}", "Toll Page Classifier")
+            return None
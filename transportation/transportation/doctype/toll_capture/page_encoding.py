@@ -0,0 +1,163 @@
+import base64
+import io
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional
+import fitz
+from frappe.utils import cint
+from PIL import Image
+from .page_classifier import AMBIGUOUS, EMPTY, PageClassifier
+from .page_layout import crop_table, resolve_layout, split_sections
+
+RENDER_MATRIX = (2, 2)  # 2x resolution
+MAX_DEFAULT_WORKERS = 4
+MIN_POOL_PAGES = 4  # Below this many pages, starting workers costs more than it saves
+# Section format setting -> (PIL format, file extension, media type)
+IMAGE_FORMATS = {
+    "JPEG": ("JPEG", "jpg", "image/jpeg"),
+    "WebP": ("WEBP", "webp", "image/webp")
+}
+
+# PDFs opened by this process, so a worker parses each document once
+_open_documents: Dict[str, fitz.Document] = {}
+# Local classifier of this process, set when the encoder starts
+_classifier: Optional[PageClassifier] = None
+
+class PageEncoder:
+    """Prepares toll statement pages on a process pool.
+
+    `prepare()` renders, classifies, crops and encodes a page in one worker
+    call and returns a Future of the encoded bytes and measurements only, so
+    the full-page image never crosses a process boundary. The caller keeps
+    several pages in flight while doing database work on its own thread. The
+    pool uses the spawn start method, so workers never inherit the parent's
+    database connections. For a single worker or a short document the work
+    runs inline in the calling process instead. Use as a context manager.
+    """
+    def __init__(self, file_path: str, toll_settings, page_count: int, classifier: Optional[PageClassifier] = None):
+        self.file_path = file_path
+        workers = cint(toll_settings.encoding_workers) or min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS)
+        self.workers = max(1, min(workers, page_count)) if page_count >= MIN_POOL_PAGES else 1
+        self.options = {
+            "image_format": toll_settings.section_format or "JPEG",
+            "quality": cint(toll_settings.section_quality) or 95,
+            "grayscale": bool(cint(toll_settings.grayscale_sections))
+        }
+        self.extension = IMAGE_FORMATS[self.options["image_format"]][1]
+        self.classifier = classifier
+        self.layouts: Dict[str, Dict] = {}  # Layouts by page signature, sent with every page
+        self._pool = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=set_classifier,
+                initargs=(self.classifier,)
+            )
+        else:
+            set_classifier(self.classifier)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool:
+            self._pool.shutdown(cancel_futures=True)
+        else:
+            set_classifier(None)
+            close_document(self.file_path)
+
+    def prepare(self, page_number: int, classify: bool, model_check: bool) -> Future:
+        """Future of `prepare_page` for a zero-based page number"""
+        return self._submit(
+            prepare_page,
+            self.file_path,
+            page_number,
+            classify,
+            model_check,
+            self.layouts,
+            self.options
+        )
+
+    def _submit(self, fn, *args) -> Future:
+        if self._pool:
+            return self._pool.submit(fn, *args)
+
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+def set_classifier(classifier: Optional[PageClassifier]) -> None:
+    global _classifier
+    _classifier = classifier
+
+def prepare_page(
+    file_path: str,
+    page_number: int,
+    classify: bool,
+    model_check: bool,
+    layouts: Dict[str, Dict],
+    options: Dict
+) -> Dict:
+    """Render one page and reduce it to what the caller stores or sends.
+
+    With `classify`, the page is measured by the process's local classifier
+    first and an empty page stops there. With `model_check`, a page the
+    classifier could not decide is also encoded whole as a data URL for the
+    model's validity check. Every other page is cropped to its table and its
+    sections encoded. Returns a dict of verdict, scores, classify_error,
+    data_url, sections, and the page signature and layout when the layout
+    was newly detected.
+    """
+    image = render_page(file_path, page_number)
+    page = {"verdict": AMBIGUOUS, "scores": None, "classify_error": None, "data_url": None, "sections": []}
+
+    if classify and _classifier:
+        try:
+            page["verdict"], page["scores"] = _classifier.classify(image)
+        except Exception as e:
+            page["classify_error"] = str(e)
+        if page["verdict"] == EMPTY:
+            return page
+
+    if model_check and page["verdict"] == AMBIGUOUS:
+        page["data_url"] = encode_data_url(image, options)
+
+    is_first_page = page_number == 0
+    signature, layout, detected = resolve_layout(image, is_first_page, layouts)
+    if detected:
+        page.update(signature=signature, layout=layout)
+    page["sections"] = encode_page_sections(image, layout, is_first_page, options)
+    return page
+
+def render_page(file_path: str, page_number: int) -> Image.Image:
+    document = _open_documents.get(file_path)
+    if document is None:
+        document = _open_documents[file_path] = fitz.open(file_path)
+    pix = document[page_number].get_pixmap(matrix=fitz.Matrix(*RENDER_MATRIX))
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+def close_document(file_path: str) -> None:
+    document = _open_documents.pop(file_path, None)
+    if document is not None:
+        document.close()
+
+def encode_page_sections(image: Image.Image, layout: Dict, is_first_page: bool, options: Dict) -> List[bytes]:
+    """Crop the table, split it into sections and encode each one"""
+    table = crop_table(image, layout)
+    return [encode_image(section, **options) for section in split_sections(table, is_first_page)]
+
+def encode_data_url(image: Image.Image, options: Dict) -> str:
+    media_type = IMAGE_FORMATS[options["image_format"]][2]
+    return f"data:{media_type};base64,{base64.b64encode(encode_image(image, **options)).decode('utf-8')}"
+
+def encode_image(image: Image.Image, image_format: str = "JPEG", quality: int = 95, grayscale: bool = False) -> bytes:
+    if grayscale:
+        image = image.convert("L")
+    buffer = io.BytesIO()
+    image.save(buffer, format=IMAGE_FORMATS[image_format][0], quality=quality)
+    return buffer.getvalue()
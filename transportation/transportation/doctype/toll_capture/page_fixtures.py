@@ -0,0 +1,57 @@
+"""Synthetic toll statement pages shared by the page classifier, layout and encoder tests"""
+import fitz
+from PIL import Image, ImageDraw
+from .page_layout import PAGE_TABLE
+
+# Roughly an A4 page rendered at 190 dpi
+WIDTH, HEIGHT = 1600, 2200
+
+def blank_page():
+    return Image.new("RGB", (WIDTH, HEIGHT), "white")
+
+def text_lines(page, tops, width=0.3):
+    draw = ImageDraw.Draw(page)
+    for top in tops:
+        draw.rectangle((200, top, 200 + int(WIDTH * width), top + 24), fill="black")
+    return page
+
+def table_page():
+    page = blank_page()
+    draw = ImageDraw.Draw(page)
+    left, right, top = 160, 1390, 500
+    for row in range(12):
+        draw.line((left, top + row * 100, right, top + row * 100), fill="black", width=3)
+    for column in (left, 500, 900, 1200, right):
+        draw.line((column, top, column, top + 1100), fill="black", width=3)
+    return text_lines(page, [top + 40 + row * 100 for row in range(11)], width=0.1)
+
+def grid_page(left, right, columns=()):
+    """Page with a ruled table between `left` and `right` (fractions of the page width)"""
+    page = blank_page()
+    draw = ImageDraw.Draw(page)
+    x0, x1 = int(left * WIDTH), int(right * WIDTH)
+    y0, y1 = int(PAGE_TABLE[1] * HEIGHT), int(PAGE_TABLE[3] * HEIGHT)
+    for y in range(y0, y1, 100):
+        draw.line((x0, y, x1, y), fill="black", width=3)
+    for x in (x0, x1, *(int(column * WIDTH) for column in columns)):
+        draw.line((x, y0, x, y1), fill="black", width=3)
+    return page
+
+def statement_pdf(path):
+    """Three pages: a ruled transaction table, a blank page and a couple of loose text lines"""
+    document = fitz.open()
+    table = document.new_page(width=595, height=842)
+    top, bottom = 0.225 * 842, 0.865 * 842
+    for row in range(12):
+        y = top + row * (bottom - top) / 11
+        table.draw_line((0.1 * 595, y), (0.87 * 595, y), width=1.5)
+        if row < 11:
+            table.insert_text((0.12 * 595, y + 12), "2024-01-01 12:00  ETAG123456  R 12.00", fontsize=7)
+    for x in (0.1, 0.3, 0.5, 0.7, 0.87):
+        table.draw_line((x * 595, top), (x * 595, bottom), width=1.5)
+    document.new_page(width=595, height=842)
+    sparse = document.new_page(width=595, height=842)
+    for line in range(2):
+        sparse.insert_text((60, 200 + line * 30), "Statement continues overleaf " * 2, fontsize=14)
+    document.save(path)
+    document.close()
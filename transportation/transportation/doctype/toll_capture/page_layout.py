@@ -0,0 +1,180 @@
+import hashlib
+from typing import Dict, List, Optional, Tuple
+import frappe
+import numpy as np
+from PIL import Image
+from .page_classifier import ANALYSIS_WIDTH, INK_LEVEL, RULE_FILL
+
+LAYOUT_CACHE_KEY = "transportation:toll_layouts:v2"  # Bump the version whenever detect_layout output changes
+LAYOUT_CACHE_SECONDS = 30 * 24 * 3600
+
+# Fixed layout of the SANRAL statement, used whenever no table grid is found.
+# Table boxes are (left, top, right, bottom) fractions of the page.
+FIRST_PAGE_TABLE = (0.10, 0.605, 0.87, 0.85)
+PAGE_TABLE = (0.10, 0.225, 0.87, 0.865)
+SKIPPED_COLUMNS = (0.585, 0.92)  # Span of the table width left out of every crop
+FIRST_PAGE_SPLITS = [0, 0.424, 1.0]
+PAGE_SPLITS = [0, 0.222, 0.445, 0.668, 0.89, 1.0]
+
+SEARCH_MARGIN = 0.1  # How far beyond the fixed table box to look for its ruling lines
+COLUMN_SNAP = 0.03  # Largest distance (share of table width) a skipped column edge moves to meet a ruling line
+COLUMN_RULE_FILL = 0.9  # Share of the cropped table's height a column must be ink for it to be a vertical ruling line
+MIN_GAP_ROWS = 3
+BAND_PADDING = 4
+
+def get_layouts() -> Dict[str, Dict]:
+    """Every cached layout by page signature.
+
+    Detected layouts are cached under a signature of the page header, so the
+    grid is found once per statement layout and reused for every later page
+    and statement with the same header. The hash expires LAYOUT_CACHE_SECONDS
+    after the last new layout.
+    """
+    layouts = frappe.cache().hgetall(LAYOUT_CACHE_KEY) or {}
+    return {frappe.safe_decode(signature): layout for signature, layout in layouts.items()}
+
+def save_layout(signature: str, layout: Dict) -> None:
+    cache = frappe.cache()
+    cache.hset(LAYOUT_CACHE_KEY, signature, layout)
+    cache.expire(cache.make_key(LAYOUT_CACHE_KEY), LAYOUT_CACHE_SECONDS)
+
+def resolve_layout(image: Image.Image, is_first_page: bool, layouts: Dict[str, Dict]) -> Tuple[str, Dict, bool]:
+    """(signature, layout, newly detected) for a rendered page, without touching frappe.
+
+    Uses the layout in `layouts` for the page's signature, else detects the
+    grid, else falls back to the fixed SANRAL layout.
+    """
+    signature = page_signature(image, is_first_page)
+    if signature in layouts:
+        return signature, layouts[signature], False
+
+    layout = detect_layout(image, is_first_page)
+    if layout:
+        return signature, layout, True
+
+    return signature, {"table": FIRST_PAGE_TABLE if is_first_page else PAGE_TABLE, "skip": SKIPPED_COLUMNS}, False
+
+def page_signature(image: Image.Image, is_first_page: bool) -> str:
+    """Hash of a coarse binarised thumbnail of the page header, which repeats on every page of a layout"""
+    header = image.crop((0, 0, image.width, int(image.height * 0.15))).convert("L").resize((48, 12))
+    bits = np.asarray(header) < INK_LEVEL
+    digest = hashlib.sha256(np.packbits(bits).tobytes())
+    digest.update(f"{image.width}x{image.height}:{int(is_first_page)}".encode())
+    return digest.hexdigest()[:32]
+
+def detect_layout(image: Image.Image, is_first_page: bool) -> Optional[Dict]:
+    """Locate the transaction table from its ruling lines; None when the page has no usable grid"""
+    scale = ANALYSIS_WIDTH / float(image.width)
+    gray = image.convert("L").resize((ANALYSIS_WIDTH, max(1, round(image.height * scale))))
+    ink = np.asarray(gray) < INK_LEVEL
+    height, width = ink.shape
+
+    fixed = FIRST_PAGE_TABLE if is_first_page else PAGE_TABLE
+    search_top = max(0, int((fixed[1] - SEARCH_MARGIN) * height))
+    search_bottom = min(height, int((fixed[3] + SEARCH_MARGIN) * height))
+    rule_rows = search_top + np.flatnonzero(ink[search_top:search_bottom].mean(axis=1) >= RULE_FILL)
+    if len(rule_rows) < 2:
+        return None
+
+    # The layout is reused for every page with the same header, so never end
+    # above the fixed table bottom: a short last page must not cut off full pages
+    top, bottom = int(rule_rows[0]), max(int(rule_rows[-1]) + 1, int(fixed[3] * height))
+    # Rules that run past the fixed table (page borders, header lines) must not widen it
+    fixed_left, fixed_right = fixed[0] * width, fixed[2] * width
+    ruled_columns = np.flatnonzero(ink[rule_rows].any(axis=0))
+    left = max(int(ruled_columns[0]), int(fixed_left))
+    right = min(int(ruled_columns[-1]) + 1, int(np.ceil(fixed_right)))
+    if right - left < width * 0.5 or bottom - top < height * 0.05:
+        return None
+
+    # SKIPPED_COLUMNS are fractions of the fixed table; express them as fractions of the detected one
+    unsnapped = [
+        min(1.0, max(0.0, (fixed_left + edge * (fixed_right - fixed_left) - left) / float(right - left)))
+        for edge in SKIPPED_COLUMNS
+    ]
+    table = ink[top:bottom, left:right]
+    vertical_rules = _run_centres(table.mean(axis=0) >= RULE_FILL) / float(right - left)
+    skip = [_snap(edge, vertical_rules) for edge in unsnapped]
+    if skip[1] <= skip[0]:
+        skip = unsnapped
+
+    return {
+        "table": [round(left / width, 4), round(top / height, 4), round(right / width, 4), round(bottom / height, 4)],
+        "skip": [round(edge, 4) for edge in skip]
+    }
+
+def crop_table(image: Image.Image, layout: Dict) -> Image.Image:
+    """Crop the table box and drop the skipped columns in one array operation"""
+    left, top, right, bottom = (
+        int(fraction * size)
+        for fraction, size in zip(layout["table"], (image.width, image.height, image.width, image.height))
+    )
+    pixels = np.asarray(image.convert("RGB"))[top:bottom, left:right]
+    split_point = int(pixels.shape[1] * layout["skip"][0])
+    join_point = int(pixels.shape[1] * layout["skip"][1])
+    return Image.fromarray(np.ascontiguousarray(np.hstack((pixels[:, :split_point], pixels[:, join_point:]))))
+
+def row_bands(image: Image.Image, count: int) -> List[Tuple[int, int]]:
+    """Up to `count` (top, bottom) bands tightly enclosing the table rows, split between rows.
+
+    Splits are placed on ruling lines when the table has them, otherwise in
+    the whitespace between text rows, as close as possible to equal heights.
+    Returns an empty list when the image has no rows to split.
+    """
+    ink = np.asarray(image.convert("L")) < INK_LEVEL
+    # Vertical ruling lines put ink on every row, including the gaps between text rows
+    ink = ink[:, ink.mean(axis=0) < COLUMN_RULE_FILL]
+    if not ink.size:
+        return []
+    row_fill = ink.mean(axis=1)
+    content = row_fill > 0.002
+    content_rows = np.flatnonzero(content)
+    if not len(content_rows):
+        return []
+
+    first, last = int(content_rows[0]), int(content_rows[-1]) + 1
+    candidates = _run_centres(row_fill >= RULE_FILL)
+    if len(candidates) < count:
+        candidates = _run_centres(~content, MIN_GAP_ROWS)
+    candidates = candidates[(candidates > first) & (candidates < last)]
+
+    splits = [first]
+    for k in range(1, count):
+        target = first + (last - first) * k / count
+        if len(candidates):
+            split = int(candidates[np.abs(candidates - target).argmin()])
+            if split > splits[-1]:
+                splits.append(split)
+    splits.append(last)
+
+    bands = []
+    for top, bottom in zip(splits, splits[1:]):
+        rows = np.flatnonzero(content[top:bottom])
+        if len(rows):
+            bands.append((
+                max(0, top + int(rows[0]) - BAND_PADDING),
+                min(image.height, top + int(rows[-1]) + 1 + BAND_PADDING)
+            ))
+    return bands
+
+def split_sections(image: Image.Image, is_first_page: bool) -> List[Image.Image]:
+    """Split a cropped table into sections of whole rows, or at the fixed fractions when no rows are found"""
+    splits = FIRST_PAGE_SPLITS if is_first_page else PAGE_SPLITS
+    bands = row_bands(image, len(splits) - 1) or [
+        (int(image.height * top), int(image.height * bottom))
+        for top, bottom in zip(splits, splits[1:])
+    ]
+    return [image.crop((0, top, image.width, bottom)) for top, bottom in bands]
+
+def _run_centres(mask: np.ndarray, min_length: int = 1) -> np.ndarray:
+    """Centre index of every run of True at least `min_length` long"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    keep = ends - starts >= min_length
+    return (starts[keep] + ends[keep] - 1) // 2
+
+def _snap(edge: float, rules: np.ndarray) -> float:
+    if not len(rules):
+        return edge
+    nearest = float(rules[np.abs(rules - edge).argmin()])
+    return nearest if abs(nearest - edge) <= COLUMN_SNAP else edge
@@ -0,0 +1,19 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from .page_classifier import AMBIGUOUS, EMPTY, VALID, PageClassifier
+from .page_fixtures import blank_page, table_page, text_lines
+
+class TestPageClassifier(FrappeTestCase):
+    def setUp(self):
+        self.classifier = PageClassifier(frappe._dict(header_template=None, header_match_threshold=0.8))
+
+    def test_blank_page_is_empty(self):
+        self.assertEqual(self.classifier.classify(blank_page())[0], EMPTY)
+
+    def test_sparse_text_page_is_left_to_the_model(self):
+        verdict, scores = self.classifier.classify(text_lines(blank_page(), [300, 400]))
+        self.assertGreaterEqual(scores["ink_ratio"], 0.003)
+        self.assertEqual(verdict, AMBIGUOUS)
+
+    def test_ruled_table_is_valid(self):
+        self.assertEqual(self.classifier.classify(table_page())[0], VALID)
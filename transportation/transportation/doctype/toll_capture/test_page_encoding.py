@@ -0,0 +1,53 @@
+import os
+import tempfile
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from .page_classifier import AMBIGUOUS, EMPTY, VALID, PageClassifier
+from .page_encoding import MIN_POOL_PAGES, PageEncoder
+from .page_fixtures import statement_pdf
+
+class TestPageEncoder(FrappeTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "statement.pdf")
+        statement_pdf(self.path)
+        self.settings = frappe._dict(
+            encoding_workers=4,
+            section_format="JPEG",
+            section_quality=80,
+            grayscale_sections=0,
+            header_template=None,
+            header_match_threshold=0.8
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_short_documents_are_prepared_in_process(self):
+        with PageEncoder(self.path, self.settings, MIN_POOL_PAGES - 1) as encoder:
+            self.assertEqual(encoder.workers, 1)
+
+    def test_pages_come_back_as_encoded_bytes_and_measurements(self):
+        with PageEncoder(self.path, self.settings, 3, PageClassifier(self.settings)) as encoder:
+            table, blank, sparse = (encoder.prepare(page, True, True).result() for page in range(3))
+
+        self.assertEqual(table["verdict"], VALID)
+        self.assertIsNone(table["data_url"])
+        self.assertTrue(table["sections"])
+        self.assertTrue(all(isinstance(section, bytes) for section in table["sections"]))
+        self.assertIn("layout", table)
+
+        self.assertEqual(blank["verdict"], EMPTY)
+        self.assertEqual(blank["sections"], [])
+
+        self.assertEqual(sparse["verdict"], AMBIGUOUS)
+        self.assertTrue(sparse["data_url"].startswith("data:image/jpeg;base64,"))
+
+    def test_known_layouts_are_reused(self):
+        with PageEncoder(self.path, self.settings, 3, PageClassifier(self.settings)) as encoder:
+            first = encoder.prepare(0, False, False).result()
+            encoder.layouts[first["signature"]] = first["layout"]
+            again = encoder.prepare(0, False, False).result()
+
+        self.assertNotIn("layout", again)
+        self.assertEqual(len(again["sections"]), len(first["sections"]))
@@ -0,0 +1,40 @@
+from frappe.tests.utils import FrappeTestCase
+from PIL import Image, ImageDraw
+from .page_fixtures import grid_page
+from .page_layout import PAGE_TABLE, SKIPPED_COLUMNS, detect_layout, row_bands
+
+class TestDetectLayout(FrappeTestCase):
+    def test_skipped_columns_are_taken_from_the_fixed_table(self):
+        left, right = 0.12, 0.86
+        layout = detect_layout(grid_page(left, right), is_first_page=False)
+
+        fixed_width = PAGE_TABLE[2] - PAGE_TABLE[0]
+        for edge, expected in zip(layout["skip"], SKIPPED_COLUMNS):
+            page_x = PAGE_TABLE[0] + expected * fixed_width
+            self.assertAlmostEqual(edge, (page_x - left) / (right - left), delta=0.01)
+
+    def test_table_stays_inside_the_fixed_box(self):
+        layout = detect_layout(grid_page(0.02, 0.98), is_first_page=False)
+        table_left, _, table_right, _ = layout["table"]
+        self.assertGreaterEqual(table_left, PAGE_TABLE[0] - 0.001)
+        self.assertLessEqual(table_right, PAGE_TABLE[2] + 0.001)
+        self.assertEqual(layout["skip"], list(SKIPPED_COLUMNS))
+
+class TestRowBands(FrappeTestCase):
+    def test_vertical_rules_do_not_hide_the_gaps_between_rows(self):
+        table = Image.new("RGB", (1200, 600), "white")
+        draw = ImageDraw.Draw(table)
+        for x in (0, 400, 800, 1199):
+            draw.line((x, 0, x, 599), fill="black", width=3)
+        text_rows = [(40, 64), (140, 164), (340, 364), (440, 464)]
+        for top, bottom in text_rows:
+            draw.rectangle((50, top, 350, bottom), fill="black")
+
+        bands = row_bands(table, 2)
+
+        self.assertEqual(len(bands), 2)
+        (first_top, first_bottom), (second_top, second_bottom) = bands
+        self.assertLessEqual(first_top, 40)
+        self.assertLess(first_bottom, 340)
+        self.assertGreater(second_top, 164)
+        self.assertGreaterEqual(second_bottom, 464)
@@ -1,23 +1,51 @@
 frappe.ui.form.on('Toll Capture', {
+    setup: function(frm) {
+        frappe.realtime.on('toll_capture_progress', function(data) {
+            if (data.toll_capture !== frm.doc.name) return;
+
+            const title = data.stage === 'Extraction' ? __('Extracting Tolls') : __('Sectioning Pages');
+            const percent = data.total ? (data.done / data.total) * 100 : 100;
+            frm.dashboard.show_progress(title, percent, __('{0} of {1}', [data.done, data.total]));
+
+            if (data.done >= data.total) {
+                frm.dashboard.hide_progress(title);
+                frm.reload_doc();
+            }
+        });
+    },
+
     refresh: function(frm) {
         if (frm.doc.docstatus < 2) {
             frm.add_custom_button(__('Process Toll Document'), function() {
                 frappe.call({
-                    method: 'transportation.transportation.doctype.toll_page_result.process_toll_page.process_toll_pages',
+                    method: 'transportation.transportation.doctype.toll_page_result.process_toll_page.enqueue_toll_extraction',
                     args: {
                         toll_capture_id: frm.doc.name
                     },
-                    freeze: true,
-                    freeze_message: __('Extracting and creating Tolls...'),
                     callback: function(r) {
                         frappe.show_alert({
-                            message: __('Toll document processed'),
-                            indicator: 'green'
+                            message: __('Toll extraction queued'),
+                            indicator: 'blue'
                         });
-                        frm.reload_doc();
                     }
                 });
             });
         }
+
+        // Failed pages, or a run that stopped before reaching the last page
+        const interrupted = frm.doc.status === 'Unprocessed'
+            && frm.doc.page_count
+            && frm.doc.pages_processed < frm.doc.page_count;
+        if (frm.doc.status === 'Error' || interrupted) {
+            frm.add_custom_button(__('Resume Page Processing'), function() {
+                frm.call('resume_processing').then(() => {
+                    frappe.show_alert({
+                        message: __('Remaining pages queued for processing'),
+                        indicator: 'blue'
+                    });
+                    frm.reload_doc();
+                });
+            });
+        }
     }
-});
\ No newline at end of file
+});
@@ -2,70 +2,26 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 import fitz
-import io
-import base64
-from PIL import Image, ImageDraw
 import json
-import requests
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from frappe.utils import cint
+from transportation.transportation.ai_processing.providers import transport
+from transportation.transportation.ai_processing.providers.rate_limiter import get_rate_limiter
+from transportation.transportation.ai_processing.utils.tracing import tracer
+from transportation.transportation.doctype.toll_page_result.section_store import save_section_image
+from .page_classifier import EMPTY, PageClassifier
+from .page_layout import get_layouts, save_layout
+from .page_encoding import PageEncoder
+
+# Checkpoint stages after which a source page needs no more work in process_document
+DONE_STAGES = ("Skipped", "Sectioned", "Extracted")
 
 class TollCapture(Document):
     def __init__(self, *args, **kwargs):
         super(TollCapture, self).__init__(*args, **kwargs)
         
-    def format_image(self, image, is_first_page=False):
-        """Apply cropping excluding middle section in one operation"""
-        try:
-            original_width = image.width
-            original_height = image.height
-            
-            crop_left = int(original_width * 0.10)    
-            crop_right = int(original_width * 0.87)   
-            
-            if is_first_page:
-                crop_top = int(original_height * 0.605)   
-                crop_bottom = int(original_height * 0.85)
-            else:
-                crop_top = int(original_height * 0.225)    
-                crop_bottom = int(original_height * 0.865)
-            
-            cropped_image = image.crop((crop_left, crop_top, crop_right, crop_bottom))
-            
-            split_point = int(cropped_image.width * 0.585)
-            join_point = int(cropped_image.width * 0.92)
-            
-            final_width = split_point + (cropped_image.width - join_point)
-            final_image = Image.new('RGB', (final_width, cropped_image.height))
-            
-            final_image.paste(cropped_image.crop((0, 0, split_point, cropped_image.height)), (0, 0))
-            final_image.paste(cropped_image.crop((join_point, 0, cropped_image.width, cropped_image.height)), (split_point, 0))
-            
-            return final_image
-            
-        except Exception as e:
-            frappe.log_error(f"Error formatting image: {str(e)}")
-            raise e
-
-    def create_sections(self, image, is_first_page=False):
-        """Split image into sections based on page position"""
-        sections = []
-        height = image.height
-        
-        if is_first_page:
-            # Page 1 sections
-            split_point = int(height * 0.424)
-            sections.append(image.crop((0, 0, image.width, split_point)))
-            sections.append(image.crop((0, split_point, image.width, height)))
-        else:
-            # Non-page 1 sections
-            splits = [0, 0.222, 0.445, 0.668, 0.89, 1.0]
-            for i in range(len(splits) - 1):
-                top = int(height * splits[i])
-                bottom = int(height * splits[i + 1])
-                sections.append(image.crop((0, top, image.width, bottom)))
-                
-        return sections
-
     def validate(self):
         if self.status != "Unprocessed":
             return
@@ -77,66 +33,233 @@ class TollCapture(Document):
         if self.status != "Unprocessed":
             return
             
+        self.process_document()
+
+    @frappe.whitelist()
+    def resume_processing(self):
+        """Queue the pages an interrupted or failed run did not finish in a background worker"""
+        if self.status == "Processed":
+            frappe.throw(_("This toll document has already been processed"))
+            
+        self.db_set("status", "Unprocessed")
+        frappe.enqueue_doc(
+            self.doctype,
+            self.name,
+            "process_document",
+            queue="long",
+            timeout=7200,
+            job_id=f"toll_capture::{self.name}",
+            deduplicate=True
+        )
+
+    def process_document(self):
+        """Stream the PDF page by page: render -> classify -> crop -> section -> encode -> insert.
+
+        Every source page has a Toll Capture Page checkpoint row. Classification
+        and sectioning are each committed as soon as they finish, so a rerun
+        skips skipped and sectioned pages entirely and does not classify a page
+        twice; a page that fails is marked Error and the run carries on.
+        Rendering, local classification, cropping and encoding of a page run as
+        one PageEncoder task, a few pages ahead of the model checks and inserts
+        done here.
+        """
         try:
             file_path = frappe.get_site_path('public', self.toll_document.lstrip('/'))
-            pdf_document = fitz.open(file_path)
+            with fitz.open(file_path) as pdf_document:
+                page_count = len(pdf_document)
+            self.db_set("page_count", page_count, update_modified=False)
             
-            valid_pages = []
-            for pdf_page_num in range(len(pdf_document)):
-                page = pdf_document[pdf_page_num]
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x resolution
-                
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                img_buffer = io.BytesIO()
-                img.save(img_buffer, format='JPEG', quality=95)
-                img_buffer.seek(0)
-                base64_image = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
-                
-                if self._check_page_validity(base64_image, pdf_page_num + 1):
-                    valid_pages.append(pdf_page_num)
+            rows = self._page_rows(page_count)
+            remaining = [row for row in rows if row.stage not in DONE_STAGES]
+            result_number = self._next_result_number()
+            toll_settings = frappe.get_single("Toll Capture Settings")
+            publish_progress(self.name, "Sectioning", self._pages_done(), page_count)
             
-            current_page = 1
-            for idx, valid_page_num in enumerate(valid_pages):
-                page = pdf_document[valid_page_num]
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x resolution
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                
-                is_first_page = valid_page_num == 0
-                processed_img = self.format_image(img, is_first_page)
-                sections = self.create_sections(processed_img, is_first_page)
-                
-                for section in sections:
-                    buffer = io.BytesIO()
-                    section.save(buffer, format='JPEG', quality=95)
-                    buffer.seek(0)
-                    section_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                    
-                    frappe.get_doc({
-                        "doctype": "Toll Page Result",
-                        "parent_document": self.name,
-                        "page_number": current_page,
-                        "base64_image": section_base64,
-                        "status": "Unprocessed"
-                    }).insert()
-                    current_page += 1
+            mode = toll_settings.page_classification or "Local Then Model"
+            classifier = PageClassifier(toll_settings) if mode != "Model Only" else None
+            with PageEncoder(file_path, toll_settings, len(remaining), classifier) as encoder:
+                encoder.layouts.update(get_layouts())
+                pages = self._prepare_pages(encoder, remaining, mode)
+                for row, page, is_valid in self._classify_pages(pages):
+                    result_number = self._save_page(row, page["sections"] if is_valid else None, result_number, encoder.extension)
             
-            self.status = "Processed"
+            # Failed pages keep the document in Error so they can be resumed on their own
+            self.status = "Error" if any(row.stage == "Error" for row in rows) else "Processed"
             self.save()
             frappe.db.commit()
+            publish_progress(self.name, "Sectioning", self._pages_done(), page_count)
             
         except Exception as e:
+            frappe.db.rollback()
+            self.db_set("status", "Error", update_modified=False)
+            frappe.db.commit()
             frappe.log_error(str(e))
             raise e
-        finally:
-            if 'pdf_document' in locals():
-                pdf_document.close()
 
-    def _check_page_validity(self, base64_image, page_number):
-        """Check if a page contains valid toll transactions using OpenAI's vision API"""
+    def _page_rows(self, page_count):
+        """Checkpoint rows of every source page in page order, created on the first run.
+
+        Pages an earlier run committed before checkpoint rows existed count as sectioned.
+        """
+        existing = {row.page_number for row in self.pages}
+        for page_number in range(1, page_count + 1):
+            if page_number not in existing:
+                self.append("pages", {
+                    "page_number": page_number,
+                    "stage": "Sectioned" if page_number <= cint(self.pages_processed) else "Pending"
+                }).db_insert()
+        frappe.db.commit()
+        return sorted(self.pages, key=lambda row: row.page_number)
+
+    def _pages_done(self):
+        return sum(1 for row in self.pages if row.stage in DONE_STAGES)
+
+    def _save_page(self, row, sections, result_number, extension):
+        """Insert the encoded sections of a page and commit its checkpoint; returns the next result number"""
+        if sections:
+            try:
+                for section_bytes in sections:
+                    self._insert_page_result(section_bytes, result_number, row.page_number - 1, extension)
+                    result_number += 1
+                row.db_set({"stage": "Sectioned", "sections": len(sections), "error": None}, update_modified=False)
+            except Exception as e:
+                frappe.db.rollback()
+                self._fail_page(row, f"Sectioning failed: {str(e)}")
+        
+        self.db_set("pages_processed", self._pages_done(), update_modified=False)
+        frappe.db.commit()
+        publish_progress(self.name, "Sectioning", self.pages_processed, self.page_count)
+        return result_number
+
+    def _fail_page(self, row, error):
+        frappe.log_error(f"Toll Capture {self.name} page {row.page_number}: {error}", "Toll Page Error")
+        row.db_set({"stage": "Error", "error": error[:1000]}, update_modified=False)
+        frappe.db.commit()
+
+    def _next_result_number(self):
+        """Continue Toll Page Result numbering after results committed by an earlier run"""
+        last = frappe.get_all(
+            "Toll Page Result",
+            filters={"parent_document": self.name},
+            fields=["max(page_number) as last_page_number"]
+        )
+        return cint(last[0].last_page_number if last else 0) + 1
+
+    def _prepare_pages(self, encoder, rows, mode):
+        """Yield (row, page) in order, preparing up to one page per encoder worker ahead.
+
+        Pages classified by an earlier run skip the local classifier. Layouts
+        a worker detects are cached and sent with every later page.
+        """
+        preparing = deque()
+        for row in rows:
+            classify = row.stage != "Classified" and mode != "Model Only"
+            model_check = row.stage != "Classified" and mode != "Local Only"
+            preparing.append((row, encoder.prepare(row.page_number - 1, classify, model_check)))
+            if len(preparing) >= encoder.workers:
+                yield self._prepared_page(encoder, *preparing.popleft())
+        
+        while preparing:
+            yield self._prepared_page(encoder, *preparing.popleft())
+
+    def _prepared_page(self, encoder, row, future):
+        """(row, page); page is {"error": ...} when preparing it failed"""
+        try:
+            page = future.result()
+        except Exception as e:
+            return row, {"error": str(e)}
+        
+        if page.get("layout") and page["signature"] not in encoder.layouts:
+            encoder.layouts[page["signature"]] = page["layout"]
+            save_layout(page["signature"], page["layout"])
+        if page["classify_error"]:
+            frappe.log_error(
+                f"Local classification of page {row.page_number} failed: {page['classify_error']}",
+                "Toll Page Classifier"
+            )
+        elif page["scores"]:
+            tracer.debug("toll.page_measured", toll_capture=self.name, page=row.page_number, verdict=page["verdict"], **page["scores"])
+        return row, page
+
+    def _classify_pages(self, pages):
+        """Yield (row, page, is_valid) in page order while classifying pages concurrently.
+
+        Pages classified by an earlier run reuse the recorded verdict, and pages
+        the local classifier decided in the encoder keep its verdict. Only pages
+        prepared with a data URL for the model are checked by it, on a pool
+        capped at the ChatGPT Settings `max_concurrent_requests`. A new page is
+        only pulled from `pages` once the oldest in-flight one has been handed
+        downstream.
+        """
         provider_settings = frappe.get_single("ChatGPT Settings")
+        max_in_flight = max(1, cint(provider_settings.max_concurrent_requests) or 1)
+        request_context = self._validity_request_context(provider_settings)
+        gate = transport.RateLimitGate()
+        transport.reserve_connections(max_in_flight)
         
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            in_flight = deque()
+            for row, page in pages:
+                if len(in_flight) >= max_in_flight:
+                    yield self._classification_result(*in_flight.popleft())
+                
+                future = Future()
+                if page.get("error"):
+                    future.set_result((False, f"Preparing the page failed: {page['error']}"))
+                    in_flight.append((row, page, future, "encoder"))
+                elif row.stage == "Classified":
+                    future.set_result((bool(row.is_valid), None))
+                    in_flight.append((row, page, future, "checkpoint"))
+                elif page["data_url"]:
+                    future = executor.submit(self._check_page_validity, request_context, page["data_url"], gate)
+                    in_flight.append((row, page, future, "model"))
+                else:
+                    # Decided locally; "Local Only" sends undecided pages on to extraction
+                    future.set_result((page["verdict"] != EMPTY, None))
+                    in_flight.append((row, page, future, "local"))
+            
+            while in_flight:
+                yield self._classification_result(*in_flight.popleft())
+
+    def _classification_result(self, row, page, future, source):
+        """Record a page's verdict as its checkpoint and pass the page on"""
+        is_valid, error = future.result()
+        if error:
+            self._fail_page(row, error if source == "encoder" else f"Failed to check page validity: {error}")
+            return row, page, False
+        
+        if source != "checkpoint":
+            tracer.info(
+                "toll.page_validity",
+                toll_capture=self.name,
+                page=row.page_number,
+                is_valid=is_valid,
+                source=source
+            )
+            row.db_set({
+                "stage": "Classified" if is_valid else "Skipped",
+                "is_valid": int(is_valid),
+                "classified_by": source,
+                "error": None
+            }, update_modified=False)
+            frappe.db.commit()
+        return row, page, is_valid
+
+    def _insert_page_result(self, section_bytes, result_number, pdf_page_num, extension="jpg"):
+        page_result = frappe.get_doc({
+            "doctype": "Toll Page Result",
+            "parent_document": self.name,
+            "page_number": result_number,
+            "source_page": pdf_page_num + 1,
+            "status": "Unprocessed"
+        }).insert()
+        save_section_image(page_result, section_bytes, extension)
+
+    def _validity_request_context(self, provider_settings):
+        """URL, headers and payload template for the validity check, resolved on the request thread"""
+        api_key = provider_settings.get_password('api_key')
         headers = {
-            "Authorization": f"Bearer {provider_settings.get_password('api_key')}",
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
 
@@ -158,12 +281,6 @@ class TollCapture(Document):
                         {
                             "type": "text",
                             "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
                         }
                     ]
                 }
@@ -173,13 +290,45 @@ class TollCapture(Document):
             "response_format": {"type": "json_object"}
         }
 
+        return {
+            "url": f"{transport.get_base_url(provider_settings)}/chat/completions",
+            "headers": headers,
+            "data": data,
+            "limiter": get_rate_limiter(provider_settings, api_key, "bulk")
+        }
+
+    def _check_page_validity(self, request_context, image_url, gate):
+        """Check if a page contains valid toll transactions using OpenAI's vision API.
+
+        `image_url` is the page's data URL from the encoder.
+        Runs on a pool thread, so it must not touch frappe; returns (is_valid, error).
+        """
+        data = dict(request_context["data"])
+        system_message, user_message = data["messages"]
+        data["messages"] = [
+            system_message,
+            {
+                "role": "user",
+                "content": user_message["content"] + [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url
+                        }
+                    }
+                ]
+            }
+        ]
+
         for attempt in range(3):
             try:
-                response = requests.post(
-                    f"{provider_settings.base_url.rstrip('/')}/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=300
+                gate.wait()
+                response = transport.post_json(
+                    request_context["url"],
+                    request_context["headers"],
+                    data,
+                    timeout=300,
+                    limiter=request_context["limiter"]
                 )
                 
                 if response.status_code == 200:
@@ -187,24 +336,27 @@ class TollCapture(Document):
                     content = result['choices'][0]['message']['content']
                     parsed_content = json.loads(content)
                     
-                    is_valid = parsed_content.get('contains_valid_toll_transactions') == 'yes'
-                    frappe.log_error(
-                        f"Page {page_number} validity check: {is_valid}",
-                        "Toll Page Validation"
-                    )
-                    return is_valid
+                    return parsed_content.get('contains_valid_toll_transactions') == 'yes', None
+                
+                if response.status_code == 429:
+                    gate.backoff(response)
                 
                 if response.status_code >= 400:
                     raise Exception(f"API error {response.status_code}: {response.text}")
                     
             except Exception as e:
                 if attempt == 2:
-                    frappe.log_error(
-                        f"Failed to check page {page_number} validity: {str(e)}",
-                        "Toll Page Validation Error"
-                    )
-                    return False
+                    return False, str(e)
                     
             time.sleep(2 ** attempt)
         
-        return False
\ No newline at end of file
+        return False, None
+
+def publish_progress(toll_capture, stage, done, total):
+    """Push job progress to anyone viewing the Toll Capture form"""
+    frappe.publish_realtime(
+        "toll_capture_progress",
+        {"toll_capture": toll_capture, "stage": stage, "done": done, "total": total},
+        doctype="Toll Capture",
+        docname=toll_capture
+    )
@@ -1,52 +1,189 @@
 import frappe
 import json
-import requests
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from frappe.utils import cint, get_datetime
+from transportation.transportation.ai_processing.providers import transport
+from transportation.transportation.ai_processing.providers.rate_limiter import get_rate_limiter
+from .section_store import load_section_data_url
+from transportation.transportation.ai_processing.utils.tracing import tracer
+from transportation.transportation.ai_processing.utils.result_cache import ResultCache
+from transportation.transportation.doctype.tolls.etag_index import normalise_etag
+from transportation.transportation.doctype.tolls.tolls import bulk_insert_tolls
+from transportation.transportation.doctype.toll_capture.toll_capture import publish_progress
+
+@frappe.whitelist()
+def enqueue_toll_extraction(toll_capture_id):
+    """Queue extraction of a Toll Capture's sections; progress is published to its form"""
+    frappe.get_doc("Toll Capture", toll_capture_id).check_permission("write")
+    frappe.enqueue(
+        "transportation.transportation.doctype.toll_page_result.process_toll_page.process_toll_pages",
+        queue="long",
+        timeout=7200,
+        job_id=f"toll_extraction::{toll_capture_id}",
+        deduplicate=True,
+        toll_capture_id=toll_capture_id
+    )
 
 @frappe.whitelist()
 def process_toll_pages(toll_capture_id):
+    """Extract every section not yet processed; sections that failed on an earlier run are retried"""
+    # Only the columns needed here; section images are loaded one page at a time
     toll_pages = frappe.get_all(
         "Toll Page Result",
-        filters={"parent_document": toll_capture_id, "status": "Unprocessed"},
-        fields=["name"]
+        filters={"parent_document": toll_capture_id, "status": ["in", ["Unprocessed", "Error"]]},
+        fields=["name", "section_image"],
+        order_by="page_number asc"
     )
+    if not toll_pages:
+        _mark_extracted_pages(toll_capture_id)
+        return
+    
+    # Configuration is loaded once per batch, not once per page
+    extraction_context = _load_extraction_context()
+    max_in_flight = extraction_context["max_in_flight"]
+    sections_per_request = extraction_context["sections_per_request"]
+    gate = transport.RateLimitGate()
+    result_cache = ResultCache("toll_section", extraction_context["ai_config"])
+    progress = frappe._dict(toll_capture=toll_capture_id, done=0, total=len(toll_pages))
+    transport.reserve_connections(max_in_flight)
+    
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = {}
+        pending = []
+        for index, doc in enumerate(toll_pages):
+            try:
+                image_url = load_section_data_url(doc)
+                cache_key = ResultCache.make_key(
+                    image_url,
+                    extraction_context["model"],
+                    extraction_context["prompt"]
+                )
+                # Sections already extracted from an identical image skip the model
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    _save_toll_page(doc, cached)
+                    _section_finished(progress)
+                else:
+                    pending.append((doc, image_url, cache_key))
+            except Exception as e:
+                _handle_error(doc, f"Toll processing failed: {str(e)}")
+                _section_finished(progress)
+            
+            if len(pending) < sections_per_request and index < len(toll_pages) - 1:
+                continue
+            if not pending:
+                continue
+            
+            if len(in_flight) >= max_in_flight:
+                _save_completed_pages(in_flight, result_cache, progress)
+            
+            images = [image_url for _, image_url, _ in pending]
+            future = executor.submit(_extract_sections, extraction_context, images, gate)
+            in_flight[future] = [(doc, cache_key) for doc, _, cache_key in pending]
+            pending = []
+        
+        while in_flight:
+            _save_completed_pages(in_flight, result_cache, progress)
     
-    for page in toll_pages:
+    _mark_extracted_pages(toll_capture_id)
+
+def _load_extraction_context():
+    """Settings, credentials and prompt shared by every page extraction in a batch"""
+    ai_config = frappe.get_single("AI Config")
+    if not ai_config.active:
+        frappe.throw("AI processing is disabled")
+
+    provider_settings = frappe.get_single("ChatGPT Settings")
+    ocr_settings = frappe.get_doc("OCR Settings", "Toll Capture Config")
+    toll_settings = frappe.get_single("Toll Capture Settings")
+
+    api_key = provider_settings.get_password('api_key')
+
+    return {
+        "ai_config": ai_config,
+        "url": f"{transport.get_base_url(provider_settings)}/chat/completions",
+        "headers": {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        },
+        "model": provider_settings.heavy_lifter_model,
+        "temperature": float(provider_settings.temperature),
+        "prompt": ocr_settings.language_prompt,
+        "max_in_flight": max(1, cint(provider_settings.max_concurrent_requests) or 1),
+        "sections_per_request": max(1, cint(toll_settings.sections_per_request) or 1),
+        # Toll pages are bulk work: they leave headroom for interactive delivery notes
+        "limiter": get_rate_limiter(provider_settings, api_key, "bulk")
+    }
+
+def _save_completed_pages(in_flight, result_cache, progress):
+    """Wait for at least one extraction request to finish and commit the Tolls of its sections"""
+    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+    for future in done:
+        sections = in_flight.pop(future)
         try:
-            doc = frappe.get_doc("Toll Page Result", page.name)
-            _process_toll_page(doc)
+            responses = future.result()
         except Exception as e:
-            _handle_error(doc, f"Toll processing failed: {str(e)}")
+            for doc, _ in sections:
+                _handle_error(doc, f"Toll processing failed: {str(e)}")
+                _section_finished(progress)
+            continue
+        
+        for (doc, cache_key), response in zip(sections, responses):
+            try:
+                if response is None:
+                    raise Exception("Section missing from batched response")
+                result_cache.set(cache_key, response)
+                _save_toll_page(doc, response)
+            except Exception as e:
+                _handle_error(doc, f"Toll processing failed: {str(e)}")
+            _section_finished(progress)
 
-def _process_toll_page(doc):
-    try:
-        ai_config = frappe.get_single("AI Config")
-        if not ai_config.active:
-            raise Exception("AI processing is disabled")
+def _section_finished(progress):
+    progress.done += 1
+    publish_progress(progress.toll_capture, "Extraction", progress.done, progress.total)
+
+def _mark_extracted_pages(toll_capture_id):
+    """Move Sectioned checkpoints to Extracted once every section of the source page is processed"""
+    pending_pages = set()
+    for result in frappe.get_all(
+        "Toll Page Result",
+        filters={"parent_document": toll_capture_id, "status": ["!=", "Processed"]},
+        fields=["source_page"]
+    ):
+        pending_pages.add(cint(result.source_page))
+    
+    for row in frappe.get_all(
+        "Toll Capture Page",
+        filters={"parent": toll_capture_id, "parenttype": "Toll Capture", "stage": "Sectioned"},
+        fields=["name", "page_number"]
+    ):
+        if row.page_number not in pending_pages:
+            frappe.db.set_value("Toll Capture Page", row.name, "stage", "Extracted", update_modified=False)
+    frappe.db.commit()
 
-        provider_settings = frappe.get_single("ChatGPT Settings")
-        ocr_settings = frappe.get_doc("OCR Settings", "Toll Capture Config")
+def _extract_sections(extraction_context, images, gate):
+    """Transactions per section image, in order; a single image keeps the one-section request"""
+    if len(images) == 1:
+        return [_make_openai_request(extraction_context, images[0], gate)]
+    return _make_batched_request(extraction_context, images, gate)
 
-        response = _make_openai_request(doc, ocr_settings.language_prompt, provider_settings)
-        frappe.log_error("Processing page: " + doc.name, "Toll Debug")
+def _save_toll_page(doc, response):
+    try:
+        tracer.debug("toll.page_extracted", page=doc.name, transactions=len(response or []))
         
         _create_toll_records(response, doc)
-        doc.status = "Processed"
-        doc.save()
+        frappe.db.set_value("Toll Page Result", doc.name, "status", "Processed")
         frappe.db.commit()
 
     except Exception as e:
-        frappe.log_error(f"Error processing page {doc.name}: {str(e)}", "Toll Debug")
+        tracer.error("toll.page_failed", page=doc.name, error=str(e))
         raise
 
-def _make_openai_request(doc, prompt, provider_settings):
-    headers = {
-        "Authorization": f"Bearer {provider_settings.get_password('api_key')}",
-        "Content-Type": "application/json"
-    }
-
+def _make_openai_request(extraction_context, image_url, gate):
+    """Extract a page's transactions. Runs on a pool thread, so it must not touch frappe."""
     data = {
-        "model": provider_settings.heavy_lifter_model,
+        "model": extraction_context["model"],
         "messages": [
             {
                 "role": "system",
@@ -57,29 +194,31 @@ def _make_openai_request(doc, prompt, provider_settings):
                 "content": [
                     {
                         "type": "text",
-                        "text": prompt
+                        "text": extraction_context["prompt"]
                     },
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{doc.base64_image}"
+                            "url": image_url
                         }
                     }
                 ]
             }
         ],
         "max_tokens": 4096,
-        "temperature": float(provider_settings.temperature),
+        "temperature": extraction_context["temperature"],
         "response_format": {"type": "json_object"}
     }
 
     for attempt in range(3):
         try:
-            response = requests.post(
-                f"{provider_settings.base_url.rstrip('/')}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=300
+            gate.wait()
+            response = transport.post_json(
+                extraction_context["url"],
+                extraction_context["headers"],
+                data,
+                timeout=300,
+                limiter=extraction_context["limiter"]
             )
             
             if response.status_code == 200:
@@ -93,6 +232,9 @@ def _make_openai_request(doc, prompt, provider_settings):
                 else:
                     raise Exception("Unexpected response format")
             
+            if response.status_code == 429:
+                gate.backoff(response)
+            
             if response.status_code >= 400:
                 raise Exception(f"API error {response.status_code}: {response.text}")
                 
@@ -102,51 +244,140 @@ def _make_openai_request(doc, prompt, provider_settings):
                 
         time.sleep(2 ** attempt)
 
-def _check_duplicate_toll(transaction_date, etag_id):
+def _make_batched_request(extraction_context, images, gate):
+    """Extract several sections in one multi-image request and split the transactions back per section.
+
+    Returns one transaction list per image, or None where the model left a section out.
+    Runs on a pool thread, so it must not touch frappe.
     """
-    Check if a toll record with the same transaction_date and etag_id combination exists
-    Returns True if duplicate exists, False otherwise
+    batch_prompt = (
+        f"{extraction_context['prompt']}\n\n"
+        f"You are given {len(images)} images, each a separate section of a toll statement, numbered 1 to {len(images)} "
+        "in the order they appear. Extract the transactions of every image separately and respond with a JSON object "
+        'of the form {"sections": [{"section": 1, "transactions": [...]}, ...]} containing one entry per image.'
+    )
+
+    data = {
+        "model": extraction_context["model"],
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an expert at analyzing toll transaction tables. Return data as valid JSON."
+            },
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": batch_prompt}] + [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url
+                        }
+                    }
+                    for image_url in images
+                ]
+            }
+        ],
+        "max_tokens": min(16384, 4096 * len(images)),
+        "temperature": extraction_context["temperature"],
+        "response_format": {"type": "json_object"}
+    }
+
+    for attempt in range(3):
+        try:
+            gate.wait()
+            response = transport.post_json(
+                extraction_context["url"],
+                extraction_context["headers"],
+                data,
+                timeout=300,
+                limiter=extraction_context["limiter"]
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                content = result['choices'][0]['message']['content']
+                sections = json.loads(content).get('sections')
+                if not isinstance(sections, list):
+                    raise Exception("Unexpected response format")
+                
+                transactions_by_section = [None] * len(images)
+                for position, section in enumerate(sections):
+                    index = cint(section.get('section') or position + 1) - 1
+                    if 0 <= index < len(images) and isinstance(section.get('transactions'), list):
+                        transactions_by_section[index] = section['transactions']
+                return transactions_by_section
+            
+            if response.status_code == 429:
+                gate.backoff(response)
+            
+            if response.status_code >= 400:
+                raise Exception(f"API error {response.status_code}: {response.text}")
+                
+        except Exception as e:
+            if attempt == 2:
+                raise Exception(f"OpenAI request failed: {str(e)}")
+                
+        time.sleep(2 ** attempt)
+
+def _existing_toll_keys(transactions):
+    """(transaction_date, etag_id) keys of existing Tolls for a page, fetched in one query.
+
+    Bounded by the page's date range and e-tags so the composite
+    (transaction_date, etag_id) index on Tolls serves the lookup.
     """
-    existing_toll = frappe.get_all(
+    if not transactions:
+        return set()
+
+    dates = [transaction['transaction_date'] for transaction in transactions]
+    existing = frappe.get_all(
         "Tolls",
         filters={
-            "transaction_date": transaction_date,
-            "etag_id": etag_id.replace(" ", "")
+            "transaction_date": ["between", [min(dates), max(dates)]],
+            "etag_id": ["in", list({transaction['etag_id'] for transaction in transactions})]
         },
-        limit=1
+        fields=["transaction_date", "etag_id"]
     )
-    return len(existing_toll) > 0
+    return {(get_datetime(toll.transaction_date), toll.etag_id) for toll in existing}
 
 def _create_toll_records(response, doc):
     if not isinstance(response, list):
         raise Exception("Invalid response format from AI")
 
+    transactions = []
     for transaction in response:
         if _validate_transaction(transaction):
-            # Check for duplicates before creating new record
-            if not _check_duplicate_toll(transaction['transaction_date'], transaction['etag_id']):
-                toll = frappe.get_doc({
-                    "doctype": "Tolls",
-                    "transaction_date": transaction['transaction_date'],
-                    "tolling_point": transaction['tolling_point'],
-                    "etag_id": transaction['etag_id'].replace(" ", ""),
-                    "net_amount": transaction['net_amount'],
-                    "process_status": "Unprocessed",
-                    "parent_document": doc.name  # Add this line to set the parent document
-                })
-                toll.insert()
-            else:
-                frappe.log_error(
-                    message=f"Duplicate toll entry skipped - Date: {transaction['transaction_date']}, ETag: {transaction['etag_id']}",
-                    title="Duplicate Toll Entry"
-                )
+            transactions.append(dict(
+                transaction,
+                transaction_date=get_datetime(transaction['transaction_date']),
+                etag_id=normalise_etag(transaction['etag_id'])
+            ))
+
+    # Dedupe against stored Tolls and within this page in memory
+    seen_keys = _existing_toll_keys(transactions)
+    new_transactions = []
+    for transaction in transactions:
+        key = (transaction['transaction_date'], transaction['etag_id'])
+        if key in seen_keys:
+            tracer.info(
+                "toll.duplicate_skipped",
+                page=doc.name,
+                transaction_date=transaction['transaction_date'],
+                etag_id=transaction['etag_id']
+            )
+            continue
+        seen_keys.add(key)
+        new_transactions.append(transaction)
+
+    # One multi-row insert each for the page's Tolls and Expenses
+    bulk_insert_tolls(new_transactions, doc.name)
 
 def _validate_transaction(transaction):
     required_fields = ['transaction_date', 'tolling_point', 'etag_id', 'net_amount']
     return all(transaction.get(field) for field in required_fields)
 
 def _handle_error(doc, error_message):
-    doc.status = "Error"
-    doc.save()
+    # Drop Tolls a failed section inserted before failing, so a retry starts clean
+    frappe.db.rollback()
+    frappe.db.set_value("Toll Page Result", doc.name, "status", "Error")
     frappe.db.commit()
     frappe.log_error(message=error_message, title=f"Toll Page {doc.name} Error")
\ No newline at end of file
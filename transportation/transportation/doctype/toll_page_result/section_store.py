@@ -0,0 +1,45 @@
+import base64
+import hashlib
+import mimetypes
+import frappe
+
+def save_section_image(page_result, image_bytes, extension="jpg"):
+    """Store a section image as a private File attached to its Toll Page Result.
+
+    Files are named by content hash and frappe reuses the stored file for
+    identical content, so re-uploaded statements do not duplicate images on disk.
+    """
+    content_hash = hashlib.sha256(image_bytes).hexdigest()
+    file_doc = frappe.get_doc({
+        "doctype": "File",
+        "file_name": f"toll-section-{content_hash[:16]}.{extension}",
+        "content": image_bytes,
+        "is_private": 1,
+        "attached_to_doctype": "Toll Page Result",
+        "attached_to_name": page_result.name,
+        "attached_to_field": "section_image"
+    })
+    file_doc.insert(ignore_permissions=True)
+    page_result.db_set("section_image", file_doc.file_url, update_modified=False)
+    return file_doc.file_url
+
+def load_section_bytes(page_result):
+    """Read a section image only when it is needed for extraction"""
+    if page_result.section_image:
+        file_doc = frappe.get_doc("File", {"file_url": page_result.section_image})
+        return file_doc.get_content()
+
+    # Rows created before images moved to files
+    legacy_image = frappe.db.get_value("Toll Page Result", page_result.name, "base64_image")
+    if legacy_image:
+        return base64.b64decode(legacy_image)
+
+    frappe.throw(f"No image stored for {page_result.name}")
+
+def load_section_base64(page_result):
+    return base64.b64encode(load_section_bytes(page_result)).decode('utf-8')
+
+def load_section_data_url(page_result):
+    """Section image as a data URL, with the media type of the stored file"""
+    media_type = mimetypes.guess_type(page_result.section_image or "")[0] or "image/jpeg"
+    return f"data:{media_type};base64,{load_section_base64(page_result)}"
@@ -0,0 +1,72 @@
+import time
+from datetime import timedelta
+import frappe
+from frappe.utils import now_datetime
+from .etag_index import normalise_etag
+from .tolls import bulk_insert_tolls, create_expenses_for_tolls
+
+def run(rows=500):
+    """Rows/second of per-document Toll inserts against bulk_insert_tolls.
+
+    Inserts `rows` synthetic transactions through each path and rolls back,
+    so nothing is kept. Half the transactions use e-tags of existing
+    Transportation Assets, so both paths also create Expenses.
+
+        bench --site <site> execute transportation.transportation.doctype.tolls.benchmark.run --kwargs "{'rows': 500}"
+    """
+    rows = int(rows)
+    results = {"rows": rows}
+    try:
+        paths = (("per_document", _insert_per_document), ("bulk", bulk_insert_tolls))
+        for offset, (path, insert) in enumerate(paths):
+            transactions = _transactions(rows, offset)
+            started = time.perf_counter()
+            insert(transactions)
+            seconds = time.perf_counter() - started
+            results[path] = {
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(rows / seconds, 1) if seconds else None
+            }
+    finally:
+        frappe.db.rollback()
+
+    if results["bulk"]["seconds"]:
+        results["speedup"] = round(results["per_document"]["seconds"] / results["bulk"]["seconds"], 1)
+    return results
+
+def _insert_per_document(transactions):
+    """The insert path process_toll_page used before bulk inserts"""
+    tolls = []
+    for transaction in transactions:
+        toll = frappe.get_doc(dict(transaction, doctype="Tolls", process_status="Unprocessed"))
+        toll.flags.skip_expense_creation = True
+        toll.insert()
+        tolls.append(toll)
+    create_expenses_for_tolls(tolls)
+
+def _transactions(rows, offset):
+    """Synthetic transactions with unique dates; every other one on a known asset's e-tag"""
+    known_etags = [
+        normalise_etag(etag_number)
+        for etag_number in frappe.get_all(
+            "Transportation Asset",
+            filters={"etag_number": ["is", "set"]},
+            pluck="etag_number",
+            limit=50
+        )
+    ]
+    # Far-future dates so neither path collides with real Tolls or with the other path
+    start = now_datetime().replace(microsecond=0) + timedelta(days=3650 * (offset + 1))
+    return [
+        {
+            "transaction_date": start + timedelta(minutes=index),
+            "tolling_point": f"BENCHMARK PLAZA {index % 20}",
+            "etag_id": (
+                known_etags[index % len(known_etags)]
+                if known_etags and index % 2 == 0
+                else f"BENCH{index:08d}"
+            ),
+            "net_amount": 10 + index % 90
+        }
+        for index in range(rows)
+    ]
@@ -0,0 +1,51 @@
+import frappe
+
+INDEX_CACHE_KEY = "transportation:etag_asset_index"
+VERSION_CACHE_KEY = "transportation:etag_asset_index_version"
+
+# Per-process copy, reloaded from Redis whenever the shared version changes
+_local_index = {"version": None, "assets": {}}
+
+def normalise_etag(etag_id):
+    """e-tag IDs are read off statements and typed into assets with arbitrary spacing"""
+    return "".join(str(etag_id).split())
+
+def get_asset_for_etag(etag_id):
+    """Transportation Asset carrying the given e-tag, or None"""
+    return _get_index().get(normalise_etag(etag_id))
+
+def resolve_assets(etag_ids):
+    """Map each e-tag ID to its Transportation Asset (or None) without touching the database"""
+    index = _get_index()
+    return {etag_id: index.get(normalise_etag(etag_id)) for etag_id in etag_ids}
+
+def invalidate(doc=None, method=None, *args):
+    """Transportation Asset hook: drop the index once the change is committed"""
+    frappe.db.after_commit.add(_clear_cache)
+
+def _clear_cache():
+    frappe.cache().delete_value([INDEX_CACHE_KEY, VERSION_CACHE_KEY])
+
+def _get_index():
+    cache = frappe.cache()
+    version = cache.get_value(VERSION_CACHE_KEY)
+    if version is None:
+        version = frappe.generate_hash(length=10)
+        cache.set_value(VERSION_CACHE_KEY, version)
+
+    if _local_index["version"] != version:
+        assets = cache.get_value(INDEX_CACHE_KEY)
+        if assets is None:
+            assets = _build_index()
+            cache.set_value(INDEX_CACHE_KEY, assets)
+        _local_index.update(version=version, assets=assets)
+
+    return _local_index["assets"]
+
+def _build_index():
+    assets = frappe.get_all(
+        "Transportation Asset",
+        filters={"etag_number": ["is", "set"]},
+        fields=["name", "etag_number"]
+    )
+    return {normalise_etag(asset.etag_number): asset.name for asset in assets}
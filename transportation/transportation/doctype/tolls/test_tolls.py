@@ -0,0 +1,70 @@
+from datetime import timedelta
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import now_datetime
+from transportation.patches.v0_6 import normalise_toll_etag_ids
+from . import etag_index
+from .tolls import bulk_insert_tolls, on_doctype_update
+
+class TestTolls(FrappeTestCase):
+    def test_dedupe_index_exists_after_migrate(self):
+        on_doctype_update()
+        self.assertTrue(frappe.db.has_index("tabTolls", "transaction_date_etag_id_index"))
+
+    def test_patch_normalises_legacy_etag_ids(self):
+        toll = frappe.get_doc({
+            "doctype": "Tolls",
+            "transaction_date": now_datetime(),
+            "tolling_point": "TEST PLAZA",
+            "etag_id": "LEGACY0001",
+            "net_amount": 10,
+            "process_status": "Unprocessed"
+        })
+        toll.flags.skip_expense_creation = True
+        toll.insert()
+        toll.db_set("etag_id", " LEG ACY 0001 ", update_modified=False)
+
+        normalise_toll_etag_ids.execute()
+
+        self.assertEqual(frappe.db.get_value("Tolls", toll.name, "etag_id"), "LEGACY0001")
+
+class TestBulkInsertTolls(FrappeTestCase):
+    def setUp(self):
+        etag_number = f"TEST{frappe.generate_hash(length=8).upper()}"
+        asset = frappe.get_doc({
+            "doctype": "Transportation Asset",
+            "transportation_asset_type": "Truck",
+            "is_subbie": 1,
+            "asset_number": etag_number,
+            "license_plate": f"PLT{etag_number[-6:]}",
+            "etag_number": etag_number,
+            "status": "Active"
+        })
+        asset.flags.ignore_validate = True
+        asset.insert()
+        self.asset = asset
+        etag_index._clear_cache()
+
+    def _transaction(self, minutes):
+        return {
+            "transaction_date": now_datetime().replace(microsecond=0) + timedelta(days=3650, minutes=minutes),
+            "tolling_point": "TEST PLAZA",
+            "etag_id": self.asset.etag_number,
+            "net_amount": 25
+        }
+
+    def test_bulk_expense_matches_inserted_expense(self):
+        inserted_toll = frappe.get_doc(dict(self._transaction(0), doctype="Tolls", process_status="Unprocessed")).insert()
+        inserted_toll.reload()
+        bulk_toll, = bulk_insert_tolls([self._transaction(1)])
+
+        inserted = frappe.get_doc("Expense", inserted_toll.expense_link)
+        bulk = frappe.get_doc("Expense", bulk_toll.expense_link)
+
+        self.assertEqual(bulk.license_plate, self.asset.license_plate)
+        self.assertTrue(bulk.name.startswith(f"EXP-{self.asset.license_plate}-"))
+        self.assertEqual(bulk.name.rsplit("-", 1)[0], inserted.name.rsplit("-", 1)[0])
+        for field in ("transportation_asset", "license_plate", "expense_type", "expense_cost", "docstatus"):
+            self.assertEqual(bulk.get(field), inserted.get(field), field)
+        self.assertEqual(bulk.tolls_reference, bulk_toll.name)
+        self.assertEqual(frappe.db.get_value("Tolls", bulk_toll.name, "transportation_asset"), self.asset.name)
@@ -1,6 +1,13 @@
 import frappe
 from frappe.model.document import Document
+from frappe.model.naming import set_new_name
+from frappe.utils import now_datetime
 from datetime import datetime
+from .etag_index import get_asset_for_etag, resolve_assets
+
+def on_doctype_update():
+    """Composite index backing the (transaction_date, etag_id) duplicate check"""
+    frappe.db.add_index("Tolls", ["transaction_date", "etag_id"])
 
 def validate(doc, method):
     """Module-level validation for tolls"""
@@ -18,52 +25,133 @@ def validate(doc, method):
 
 def after_insert(doc, method):
     """Handles after_insert operations for Tolls document"""
-    try:
-        # Search for matching Transportation Asset
-        matching_asset = frappe.get_list(
-            'Transportation Asset',
-            filters={'etag_number': doc.etag_id},
-            fields=['name'],
-            limit=1
-        )
+    # Bulk creators resolve assets and expenses for the whole batch afterwards
+    if doc.flags.skip_expense_creation:
+        return
         
-        if matching_asset:
-            # Update Tolls document with transportation_asset link
-            transport_asset_id = matching_asset[0].name
-            doc.db_set('transportation_asset', transport_asset_id)
-            
-            # Create corresponding Expense record
-            expense = create_expense_record(doc, transport_asset_id)
-            
-            # Update Tolls with expense link
-            doc.db_set('expense_link', expense.name)
+    try:
+        transport_asset_id = get_asset_for_etag(doc.etag_id)
+        if transport_asset_id:
+            link_toll_to_asset(doc, transport_asset_id)
             
     except Exception as e:
         frappe.log_error(
             title="Error in Tolls after_insert",
             message=f"Error processing toll record {doc.name}: {str(e)}"
         )
+
+def create_expenses_for_tolls(tolls):
+    """Resolve assets for a batch of inserted tolls in one pass and create their Expenses"""
+    assets = resolve_assets({toll.etag_id for toll in tolls})
+    for toll in tolls:
+        transport_asset_id = assets.get(toll.etag_id)
+        if not transport_asset_id:
+            continue
+        try:
+            link_toll_to_asset(toll, transport_asset_id)
+        except Exception as e:
+            frappe.log_error(
+                title="Error in Tolls after_insert",
+                message=f"Error processing toll record {toll.name}: {str(e)}"
+            )
+
+def bulk_insert_tolls(transactions, parent_document=None):
+    """Insert a page of transactions as Tolls, with the Expenses of those on known assets.
+
+    Equivalent to inserting each Toll (the before_save validation and the
+    after_insert Expense) but validates and names everything in memory, sets
+    the Toll/Expense links up front and writes each doctype with a single
+    multi-row insert. Runs inside the caller's transaction; nothing is
+    written if any transaction fails validation. Returns the inserted Tolls.
+    """
+    assets = resolve_assets({transaction['etag_id'] for transaction in transactions})
+    asset_names = {asset for asset in assets.values() if asset}
+    # Expense names include the license plate that insert() fetches from the asset
+    license_plates = dict(frappe.get_all(
+        "Transportation Asset",
+        filters={"name": ["in", list(asset_names)]},
+        fields=["name", "license_plate"],
+        as_list=True
+    )) if asset_names else {}
+    tolls, expenses = [], []
+    for transaction in transactions:
+        toll = frappe.new_doc("Tolls")
+        toll.update({
+            "transaction_date": transaction['transaction_date'],
+            "tolling_point": transaction['tolling_point'],
+            "etag_id": transaction['etag_id'],
+            "net_amount": transaction['net_amount'],
+            "process_status": "Unprocessed",
+            "parent_document": parent_document
+        })
+        validate(toll, "before_save")
+        set_new_name(toll)
+
+        transport_asset_id = assets.get(toll.etag_id)
+        if transport_asset_id:
+            expense = build_expense_record(toll, transport_asset_id)
+            expense.license_plate = license_plates.get(transport_asset_id)
+            expense.validate_reference()
+            set_new_name(expense)
+            toll.transportation_asset = transport_asset_id
+            toll.expense_link = expense.name
+            expenses.append(expense)
+        tolls.append(toll)
+
+    _bulk_insert("Tolls", tolls)
+    _bulk_insert("Expense", expenses)
+    return tolls
+
+def _bulk_insert(doctype, docs):
+    if not docs:
+        return
+
+    timestamp = now_datetime()
+    rows = []
+    for doc in docs:
+        doc.update({
+            "owner": frappe.session.user,
+            "modified_by": frappe.session.user,
+            "creation": timestamp,
+            "modified": timestamp,
+            "docstatus": 0
+        })
+        rows.append(doc.get_valid_dict(convert_dates_to_str=True))
+
+    fields = list(rows[0])
+    frappe.db.bulk_insert(doctype, fields, [[row.get(field) for field in fields] for row in rows])
+
+def link_toll_to_asset(toll_doc, transport_asset_id):
+    """Create the toll's Expense and link both the asset and expense on the toll"""
+    toll_doc.transportation_asset = transport_asset_id
+    expense = create_expense_record(toll_doc, transport_asset_id)
+    toll_doc.db_set({
+        'transportation_asset': transport_asset_id,
+        'expense_link': expense.name
+    })
             
+def build_expense_record(toll_doc, transport_asset_id):
+    """Unsaved Expense for a Toll document"""
+    # Convert datetime to date for expense_date
+    expense_date = toll_doc.transaction_date.date() if isinstance(toll_doc.transaction_date, datetime) else toll_doc.transaction_date
+    
+    # Create expense notes
+    expense_notes = f"{toll_doc.name} Toll incurred by {transport_asset_id} on the date of {expense_date} for a total cost of {toll_doc.net_amount}"
+    
+    return frappe.get_doc({
+        "doctype": "Expense",
+        "transportation_asset": transport_asset_id,
+        "expense_type": "Toll",
+        "tolls_reference": toll_doc.name,
+        "expense_date": expense_date,
+        "expense_cost": toll_doc.net_amount,
+        "expense_notes": expense_notes
+    })
+
 def create_expense_record(toll_doc, transport_asset_id):
     """Creates an Expense record from Toll document"""
     try:
-        # Convert datetime to date for expense_date
-        expense_date = toll_doc.transaction_date.date() if isinstance(toll_doc.transaction_date, datetime) else toll_doc.transaction_date
-        
-        # Create expense notes
-        expense_notes = f"{toll_doc.name} Toll incurred by {transport_asset_id} on the date of {expense_date} for a total cost of {toll_doc.net_amount}"
-        
-        # Create new Expense document
-        expense = frappe.get_doc({
-            "doctype": "Expense",
-            "transportation_asset": transport_asset_id,
-            "expense_type": "Toll",
-            "tolls_reference": toll_doc.name,
-            "expense_date": expense_date,
-            "expense_cost": toll_doc.net_amount,
-            "expense_notes": expense_notes
-        })
-        
+        expense = build_expense_record(toll_doc, transport_asset_id)
         expense.insert()
         return expense
         
@@ -0,0 +1,55 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+class ProviderStub:
+    """Local stand-in for a provider API, for tests.
+
+    Answers every POST with `body` as JSON over keep-alive HTTP/1.1 and
+    records each request's path, payload and client port, so tests can
+    check which connections were reused. Point the app at it with
+    `ai_provider_stub_url` in site config. Use as a context manager.
+    """
+    def __init__(self, body: Dict = None, status: int = 200):
+        self.body = body if body is not None else {}
+        self.status = status
+        self.requests = []
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def client_ports(self) -> set:
+        return {request["client_port"] for request in self.requests}
+
+    def __enter__(self) -> 'ProviderStub':
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                stub.requests.append({"path": self.path, "payload": payload, "client_port": self.client_address[1]})
+                body = json.dumps(stub.body).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,79 @@
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from transportation.transportation.ai_processing.handlers import ai_handler
+from transportation.transportation.ai_processing.handlers.ai_handler import AIProcessingHandler
+
+class ExtractionTestCase(FrappeTestCase):
+    def _request(self):
+        return SimpleNamespace(
+            method="delivery_note_capture",
+            config=frappe._dict(llm_model_family="ChatGPT", retries_before_failover=1),
+            provider_settings=frappe._dict(default_model="gpt-4o", max_concurrent_requests=1),
+            api_key="primary-key",
+            fallback=frappe._dict(family="Claude", settings=frappe._dict(default_model="claude-sonnet"), api_key="fallback-key"),
+            ocr_settings=frappe._dict(language_prompt="Extract", json_example="{}"),
+            add_metrics=lambda **metrics: None
+        )
+
+    def _provider(self, response=None, error=None):
+        provider = MagicMock(response_tokens=0, retry_count=0)
+        provider.process_document.side_effect = error
+        provider.process_document.return_value = response
+        return provider
+
+    def _extract(self, providers, images=(("aW1hZ2U=", "image/jpeg"),), cached=None):
+        handler = AIProcessingHandler()
+        result_cache = MagicMock()
+        result_cache.get.return_value = cached
+        with patch.object(ai_handler, "ResultCache") as cache_class, \
+                patch.object(ai_handler, "CircuitBreaker") as breaker_class, \
+                patch.object(handler, "_create_provider", side_effect=lambda request, candidate, failover: providers[candidate.family]):
+            cache_class.return_value = result_cache
+            cache_class.make_key.side_effect = lambda image, family, model, *parts: f"{family}:{model}"
+            breaker_class.return_value.allow.return_value = True
+            responses = handler._extract_images(self._request(), list(images))
+        return responses, result_cache
+
+class TestResultCaching(ExtractionTestCase):
+    def test_primary_answers_are_cached_under_the_primary_key(self):
+        responses, result_cache = self._extract({"ChatGPT": self._provider({"trips": []})})
+        self.assertEqual(responses, [{"trips": []}])
+        result_cache.get.assert_called_once_with("ChatGPT:gpt-4o")
+        result_cache.set.assert_called_once_with("ChatGPT:gpt-4o", {"trips": []})
+
+    def test_failover_answers_are_not_cached(self):
+        responses, result_cache = self._extract({
+            "ChatGPT": self._provider(error=Exception("overloaded")),
+            "Claude": self._provider({"trips": []})
+        })
+        self.assertEqual(responses, [{"trips": []}])
+        result_cache.set.assert_not_called()
+
+class TestExtractionThreads(ExtractionTestCase):
+    def _recording_provider(self, threads):
+        provider = self._provider({"trips": []})
+        provider.process_document.side_effect = lambda *args: threads.append(threading.current_thread()) or {"trips": []}
+        return provider
+
+    def test_single_image_runs_on_the_calling_thread(self):
+        threads = []
+        with patch.object(ai_handler, "ThreadPoolExecutor") as executor:
+            self._extract({"ChatGPT": self._recording_provider(threads)})
+        executor.assert_not_called()
+        self.assertEqual(threads, [threading.current_thread()])
+
+    def test_cached_document_starts_no_pool(self):
+        with patch.object(ai_handler, "ThreadPoolExecutor") as executor:
+            responses, _ = self._extract({}, cached={"trips": []})
+        executor.assert_not_called()
+        self.assertEqual(responses, [{"trips": []}])
+
+    def test_several_images_go_to_the_pool(self):
+        threads = []
+        images = [("aW1hZ2Ux", "image/jpeg"), ("aW1hZ2Uy", "image/jpeg")]
+        responses, _ = self._extract({"ChatGPT": self._recording_provider(threads)}, images)
+        self.assertEqual(len(responses), 2)
+        self.assertNotIn(threading.current_thread(), threads)
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from transportation.patches.v0_6 import rename_ai_processing_modes
+from transportation.transportation.ai_processing import chain_builder
+
+class TestDeliveryNoteCaptureProcessing(FrappeTestCase):
+    def _process(self, processing_mode):
+        doc = MagicMock(name="Delivery Note Capture")
+        doc.name = "DNC-TEST-0001"
+        ai_config = SimpleNamespace(processing_mode=processing_mode, background_queue="long", job_timeout=1500)
+        snapshot = SimpleNamespace(ai_config=ai_config)
+        with patch.object(chain_builder, "get_config_snapshot", return_value=snapshot), \
+                patch.object(chain_builder.frappe, "enqueue") as enqueue, \
+                patch.object(chain_builder, "_run_delivery_note_chain") as run_chain:
+            chain_builder.process_delivery_note_capture(doc)
+        run_chain.assert_not_called()
+        enqueue.assert_called_once()
+        return enqueue.call_args.kwargs
+
+    def test_high_priority_runs_the_chain_at_the_front_of_the_queue(self):
+        kwargs = self._process("High Priority")
+        self.assertTrue(kwargs["at_front"])
+        self.assertEqual(kwargs["docname"], "DNC-TEST-0001")
+
+    def test_normal_priority_queues_the_chain_behind_other_work(self):
+        self.assertFalse(self._process("Normal")["at_front"])
+
+    def test_processing_stats_need_system_manager(self):
+        frappe.set_user("Guest")
+        try:
+            self.assertRaises(frappe.PermissionError, chain_builder.get_processing_stats)
+        finally:
+            frappe.set_user("Administrator")
+
+class TestRenameProcessingModes(FrappeTestCase):
+    def test_stored_modes_move_to_the_new_options(self):
+        for old, new in rename_ai_processing_modes.RENAMED_MODES.items():
+            with self.subTest(mode=old):
+                frappe.db.set_single_value("AI Config", "processing_mode", old)
+                rename_ai_processing_modes.execute()
+                self.assertEqual(frappe.db.get_single_value("AI Config", "processing_mode"), new)
@@ -0,0 +1,43 @@
+from unittest.mock import MagicMock, patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from transportation import hooks
+from transportation.transportation.ai_processing.utils import config_cache
+
+INVALIDATE = "transportation.transportation.ai_processing.utils.config_cache.invalidate"
+
+class TestConfigCache(FrappeTestCase):
+    def setUp(self):
+        config_cache._clear_cache()
+        config_cache._local_snapshot.update(version=None, snapshot=None)
+        build = patch.object(config_cache, "_build_snapshot", side_effect=lambda: object())
+        self.build = build.start()
+        self.addCleanup(build.stop)
+
+    def _save_settings(self):
+        """Run the on_update hook, returning the callbacks queued for after commit"""
+        after_commit = []
+        with patch.object(frappe, "db", MagicMock()) as db:
+            db.after_commit.add.side_effect = after_commit.append
+            config_cache.invalidate(frappe._dict(doctype="AI Config"), "on_update")
+        return after_commit
+
+    def test_snapshot_is_reused_until_invalidated(self):
+        self.assertIs(config_cache.get_config_snapshot(), config_cache.get_config_snapshot())
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_saved_settings_are_dropped_after_commit_only(self):
+        snapshot = config_cache.get_config_snapshot()
+
+        after_commit = self._save_settings()
+
+        # Until the transaction commits, other workers could rebuild from the old values
+        self.assertIs(config_cache.get_config_snapshot(), snapshot)
+        for callback in after_commit:
+            callback()
+        self.assertIsNot(config_cache.get_config_snapshot(), snapshot)
+        self.assertEqual(self.build.call_count, 2)
+
+    def test_settings_doctypes_invalidate_on_update(self):
+        for doctype in ("AI Config", "ChatGPT Settings", "Claude Settings", "OCR Settings"):
+            self.assertEqual(hooks.doc_events[doctype]["on_update"], INVALIDATE, doctype)
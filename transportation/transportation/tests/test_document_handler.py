@@ -0,0 +1,112 @@
+import io
+import os
+import tempfile
+from unittest.mock import patch
+import frappe
+from PIL import Image
+from frappe.tests.utils import FrappeTestCase
+from transportation.transportation.ai_processing.handlers import document_handler
+from transportation.transportation.ai_processing.handlers.document_handler import DocumentPreparationHandler
+from transportation.transportation.ai_processing.utils.exceptions import DocumentProcessingError
+from transportation.transportation.ai_processing.utils.request import DocumentRequest
+
+def pdf_bytes(pages):
+    images = [Image.new("RGB", (200, 280), "white") for _ in range(pages)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+def jpeg_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (200, 280), "white").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+class TestDocumentPreparation(FrappeTestCase):
+    def setUp(self):
+        files = tempfile.TemporaryDirectory()
+        self.addCleanup(files.cleanup)
+        self.files_path = files.name
+        files_patch = patch.object(document_handler, "get_files_path", return_value=self.files_path)
+        files_patch.start()
+        self.addCleanup(files_patch.stop)
+
+    def _request(self, file_name, content, trip_creation="After Extraction"):
+        with open(os.path.join(self.files_path, file_name), "wb") as upload:
+            upload.write(content)
+        request = DocumentRequest(frappe._dict(delivery_note_image=f"/files/{file_name}", employee="EMP-1"), "delivery_note_capture")
+        request.config = frappe._dict(trip_creation=trip_creation)
+        return request
+
+    def _prepare(self, request):
+        def render_page(file_path, dpi, first_page, last_page):
+            return [Image.new("RGB", (200 + first_page, 280))]
+
+        handler = DocumentPreparationHandler()
+        with patch.object(document_handler, "convert_from_path", side_effect=render_page) as convert, \
+                patch.object(handler, "_create_initial_trip", return_value=frappe._dict(name="TRIP-0000000000001")) as create_trip:
+            handler._prepare_delivery_note(request)
+        return convert, create_trip
+
+    def test_image_upload_is_read_as_is(self):
+        request = self._request("dn_scan.jpg", jpeg_bytes())
+
+        convert, _ = self._prepare(request)
+
+        self.assertEqual(request.document_type, "image")
+        self.assertEqual(request.image_bytes, jpeg_bytes())
+        self.assertIsNone(request.page_images)
+        convert.assert_not_called()
+
+    def test_pdf_is_detected_by_content_not_name(self):
+        request = self._request("dn_scan.jpg", pdf_bytes(1))
+        self._prepare(request)
+        self.assertEqual(request.document_type, "pdf")
+        self.assertIsNone(request.image_bytes)
+
+    def test_pdf_pages_are_rendered_one_at_a_time(self):
+        request = self._request("dn_scan.pdf", pdf_bytes(3))
+
+        convert, _ = self._prepare(request)
+
+        self.assertEqual(
+            [(call.kwargs["first_page"], call.kwargs["last_page"]) for call in convert.call_args_list],
+            [(1, 1), (2, 2), (3, 3)]
+        )
+        self.assertEqual(
+            [Image.open(io.BytesIO(page)).format for page in request.page_images],
+            ["JPEG"] * 3
+        )
+        self.assertEqual([Image.open(io.BytesIO(page)).width for page in request.page_images], [201, 202, 203])
+
+    def test_resumed_request_does_not_reload_the_document(self):
+        request = self._request("dn_scan.pdf", pdf_bytes(2))
+        request.ai_response = {"transactions": []}
+
+        convert, _ = self._prepare(request)
+
+        self.assertEqual(request.document_type, "pdf")
+        self.assertIsNone(request.page_images)
+        convert.assert_not_called()
+
+    def test_missing_upload(self):
+        request = self._request("dn_scan.jpg", jpeg_bytes())
+        os.remove(os.path.join(self.files_path, "dn_scan.jpg"))
+        with self.assertRaises(DocumentProcessingError):
+            self._prepare(request)
+
+    def test_placeholder_trip_only_for_images_in_placeholder_mode(self):
+        cases = (
+            ("dn_scan.jpg", jpeg_bytes(), "Placeholder Before Extraction", None, 1),
+            ("dn_scan.jpg", jpeg_bytes(), "After Extraction", None, 0),
+            ("dn_scan.pdf", pdf_bytes(1), "Placeholder Before Extraction", None, 0),
+            # A retry reuses the trip the interrupted run created
+            ("dn_scan.jpg", jpeg_bytes(), "Placeholder Before Extraction", "TRIP-0000000000009", 0),
+        )
+        for file_name, content, trip_creation, trip_id, created in cases:
+            request = self._request(file_name, content, trip_creation)
+            request.trip_id = trip_id
+
+            _, create_trip = self._prepare(request)
+
+            self.assertEqual(create_trip.call_count, created, (file_name, trip_creation, trip_id))
+            self.assertEqual(request.trip_id, "TRIP-0000000000001" if created else trip_id)
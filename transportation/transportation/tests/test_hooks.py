@@ -0,0 +1,26 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+class TestDocEvents(FrappeTestCase):
+    def test_handlers_from_both_former_doc_events_are_registered(self):
+        doc_events = frappe.get_hooks("doc_events")
+        expected = {
+            "Transportation Asset": ("validate", "transportation.transportation.doctype.transportation_asset.transportation_asset.validate"),
+            "Trip": ("validate", "transportation.transportation.doctype.trip.trip.validate"),
+            "Refuel": ("before_save", "transportation.transportation.doctype.refuel.refuel.before_save"),
+            "Tolls": ("after_insert", "transportation.transportation.doctype.tolls.tolls.after_insert"),
+            "Purchase Invoice": ("on_submit", "transportation.transportation.doctype.trip_group.trip_group.handle_purchase_invoice_submit"),
+            "Sales Invoice": ("on_submit", "transportation.transportation.doctype.trip_group.trip_group.handle_sales_invoice_submit"),
+            "DocType Label Config": ("on_update", "transportation.events.apply_custom_labels"),
+        }
+        for doctype, (event, handler) in expected.items():
+            with self.subTest(doctype=doctype):
+                self.assertIn(handler, doc_events.get(doctype, {}).get(event, []))
+
+    def test_every_handler_resolves(self):
+        for doctype, events in frappe.get_hooks("doc_events").items():
+            for event, handlers in events.items():
+                for handler in handlers:
+                    if handler.startswith("transportation."):
+                        with self.subTest(doctype=doctype, event=event):
+                            self.assertTrue(callable(frappe.get_attr(handler)))
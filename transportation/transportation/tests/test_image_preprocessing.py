@@ -0,0 +1,126 @@
+import io
+import unittest
+import numpy as np
+from PIL import Image, ImageDraw
+from frappe.tests.utils import FrappeTestCase
+from transportation.transportation.ai_processing.utils import image_preprocessing
+from transportation.transportation.ai_processing.utils.image_preprocessing import (
+    EXIF_ORIENTATION,
+    ensure_supported_format,
+    preprocess_image,
+)
+
+def encode(image, format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+def text_page(width=800, height=600, angle=0):
+    """White page with dark horizontal text lines, rotated by angle degrees"""
+    page = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(page)
+    for top in range(60, height - 60, 40):
+        draw.rectangle((80, top, width - 80, top + 12), fill="black")
+    if angle:
+        page = page.rotate(angle, resample=Image.BICUBIC, fillcolor="white")
+    return page
+
+def row_ink_peak(image):
+    """Largest share of ink in any one row: close to the line length when lines are level"""
+    gray = np.array(image.convert("L"))
+    return (gray < 128).mean(axis=1).max()
+
+class TestSupportedFormat(FrappeTestCase):
+    def test_supported_formats_pass_through(self):
+        for format, media_type in (("JPEG", "image/jpeg"), ("PNG", "image/png"), ("WEBP", "image/webp"), ("GIF", "image/gif")):
+            image_bytes = encode(text_page(200, 150), format)
+            self.assertEqual(ensure_supported_format(image_bytes), (image_bytes, media_type))
+
+    def test_mpo_is_sent_as_jpeg(self):
+        frames = [text_page(200, 150), text_page(200, 150, angle=3)]
+        image_bytes = encode(frames[0], "MPO", save_all=True, append_images=frames[1:])
+        self.assertEqual(Image.open(io.BytesIO(image_bytes)).format, "MPO")
+
+        converted, media_type = ensure_supported_format(image_bytes)
+
+        self.assertEqual(media_type, "image/jpeg")
+        self.assertEqual(Image.open(io.BytesIO(converted)).format, "JPEG")
+
+    def test_other_formats_are_converted_to_jpeg(self):
+        for format in ("TIFF", "BMP"):
+            converted, media_type = ensure_supported_format(encode(text_page(200, 150).convert("RGBA"), format))
+            self.assertEqual(media_type, "image/jpeg")
+            self.assertEqual(Image.open(io.BytesIO(converted)).format, "JPEG")
+
+    def test_undecodable_bytes_keep_a_supported_type(self):
+        self.assertEqual(ensure_supported_format(b"not an image", "scan.png"), (b"not an image", "image/png"))
+        self.assertEqual(ensure_supported_format(b"not an image", "scan.heic"), (b"not an image", "image/jpeg"))
+        self.assertEqual(ensure_supported_format(b"not an image"), (b"not an image", "image/jpeg"))
+
+class TestPreprocessImage(FrappeTestCase):
+    def test_small_supported_image_is_untouched(self):
+        image_bytes = encode(Image.new("RGB", (200, 150), "white"), "PNG")
+        self.assertEqual(
+            preprocess_image(image_bytes, auto_crop=False, deskew=False),
+            (image_bytes, "image/png")
+        )
+
+    def test_resizes_to_max_dimension(self):
+        image_bytes = encode(text_page(3000, 1500), "PNG")
+
+        processed, media_type = preprocess_image(image_bytes, max_dimension=1000, auto_crop=False, deskew=False)
+
+        self.assertEqual(media_type, "image/jpeg")
+        self.assertEqual(Image.open(io.BytesIO(processed)).size, (1000, 500))
+
+    def test_applies_exif_orientation(self):
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = 6  # rotated 90 degrees clockwise
+        image_bytes = encode(Image.new("RGB", (400, 200), "white"), "JPEG", exif=exif)
+
+        processed, _ = preprocess_image(image_bytes, auto_crop=False, deskew=False)
+
+        self.assertEqual(Image.open(io.BytesIO(processed)).size, (200, 400))
+
+    def test_mpo_is_reencoded(self):
+        image_bytes = encode(text_page(200, 150), "MPO")
+        processed, media_type = preprocess_image(image_bytes, auto_crop=False, deskew=False)
+        self.assertEqual(media_type, "image/jpeg")
+        self.assertEqual(Image.open(io.BytesIO(processed)).format, "JPEG")
+
+    def test_steps_quality_down_to_target_size(self):
+        noise = Image.fromarray(np.random.default_rng(0).integers(0, 255, (800, 800, 3), dtype=np.uint8))
+        full, _ = preprocess_image(encode(noise, "PNG"), auto_crop=False, deskew=False)
+        reduced, _ = preprocess_image(encode(noise, "PNG"), target_kb=len(full) // 2048, auto_crop=False, deskew=False)
+        self.assertLess(len(reduced), len(full))
+
+    def test_undecodable_bytes_are_returned(self):
+        self.assertEqual(preprocess_image(b"not an image", file_name="scan.webp"), (b"not an image", "image/webp"))
+
+@unittest.skipIf(image_preprocessing.cv2 is None, "OpenCV is not installed")
+class TestDocumentCleanup(FrappeTestCase):
+    def test_deskews_tilted_text(self):
+        tilted = text_page(angle=5)
+
+        straightened = image_preprocessing._deskew(np.array(tilted))
+
+        self.assertGreater(row_ink_peak(Image.fromarray(straightened)), 2 * row_ink_peak(tilted))
+
+    def test_leaves_level_and_steep_pages_alone(self):
+        for page in (text_page(), text_page(angle=30)):
+            pixels = np.array(page)
+            self.assertIs(image_preprocessing._deskew(pixels), pixels)
+
+    def test_crops_to_the_paper(self):
+        photo = Image.new("RGB", (1000, 800), (40, 40, 40))
+        photo.paste(text_page(600, 500), (200, 150))
+
+        cropped = image_preprocessing._crop_to_document(np.array(photo))
+
+        height, width = cropped.shape[:2]
+        self.assertAlmostEqual(width, 600, delta=30)
+        self.assertAlmostEqual(height, 500, delta=30)
+
+    def test_keeps_photos_without_background(self):
+        pixels = np.array(text_page())
+        self.assertIs(image_preprocessing._crop_to_document(pixels), pixels)
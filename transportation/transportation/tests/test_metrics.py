@@ -0,0 +1,18 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from transportation.transportation.ai_processing.utils.metrics import get_aggregates, record_handler
+
+class TestHandlerMetrics(FrappeTestCase):
+    def test_recorded_counters_read_back_through_get_aggregates(self):
+        document_type = f"test_{frappe.generate_hash(length=8)}"
+        record_handler(document_type, "AIProcessingHandler", "ok", 0.3, {"image_bytes": 1000, "retries": 1})
+        record_handler(document_type, "AIProcessingHandler", "ok", 7, {"image_bytes": 500})
+        record_handler(document_type, "AIProcessingHandler", "error", 1.5)
+
+        entry = get_aggregates()[(document_type, "AIProcessingHandler")]
+
+        self.assertEqual(entry["count"], {"ok": 2, "error": 1})
+        self.assertAlmostEqual(entry["duration_sum"], 8.8)
+        self.assertEqual(entry["bucket"], {"0.5": 1, "2.5": 1, "10": 1})
+        self.assertEqual(entry["image_bytes"], 1500)
+        self.assertEqual(entry["retries"], 1)
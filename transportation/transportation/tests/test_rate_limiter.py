@@ -0,0 +1,37 @@
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from transportation.transportation.ai_processing.providers import rate_limiter
+from transportation.transportation.ai_processing.providers.rate_limiter import LocalRateLimiter, RedisRateLimiter
+
+class TestRateLimiter(FrappeTestCase):
+    def _acquire_without_waiting(self, limiter, tokens):
+        with patch.object(rate_limiter.time, "sleep", side_effect=AssertionError("acquire waited")):
+            limiter.acquire(tokens)
+
+    def test_large_bulk_request_is_granted_from_a_full_local_bucket(self):
+        limiter = LocalRateLimiter(frappe.generate_hash(length=16), 0, 1000, "bulk")
+        self._acquire_without_waiting(limiter, 5000)
+        # Capped at the part of the bucket above the interactive reserve
+        self.assertEqual(limiter._state["tokens"], 200)
+
+    def test_large_bulk_request_is_granted_from_a_full_redis_bucket(self):
+        limiter = RedisRateLimiter(frappe.generate_hash(length=16), 0, 1000, "bulk")
+        self._acquire_without_waiting(limiter, 5000)
+
+    def test_large_interactive_request_may_drain_the_bucket(self):
+        limiter = LocalRateLimiter(frappe.generate_hash(length=16), 0, 1000, "interactive")
+        self._acquire_without_waiting(limiter, 5000)
+        self.assertEqual(limiter._state["tokens"], 0)
+
+    def test_bulk_request_on_a_one_request_bucket(self):
+        limiter = LocalRateLimiter(frappe.generate_hash(length=16), 1, 0, "bulk")
+        self._acquire_without_waiting(limiter, 0)
+        self.assertEqual(limiter._state["requests"], 0)
+
+    def test_bulk_request_on_a_one_request_redis_bucket(self):
+        limiter = RedisRateLimiter(frappe.generate_hash(length=16), 1, 0, "bulk")
+        self._acquire_without_waiting(limiter, 0)
+
+    def test_base_limiter_is_abstract(self):
+        self.assertRaises(TypeError, rate_limiter.RateLimiter, 10, 1000)
@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, call, patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from transportation.transportation.ai_processing.handlers import response_handler
+from transportation.transportation.ai_processing.handlers.response_handler import (
+    ResponseProcessingHandler,
+    trip_name_for_plate,
+)
+from transportation.transportation.ai_processing.utils.exceptions import DocumentProcessingError
+
+TRUCKS = {"T1": frappe._dict(name="Truck 1", license_plate="ABC-123-GP")}
+
+class TestTripNaming(FrappeTestCase):
+    def test_plate_goes_after_the_prefix(self):
+        self.assertEqual(trip_name_for_plate("TRIP-0000000000042", "ABC123"), "TRIP-ABC123-0000000000042")
+
+    def test_rest_of_the_series_name_is_kept(self):
+        self.assertEqual(trip_name_for_plate("TRIP-2026-10-0000042", "ABC123"), "TRIP-ABC123-2026-10-0000042")
+        self.assertEqual(trip_name_for_plate("TRIP-0000000000042", "AB-12-CD"), "TRIP-AB-12-CD-0000000000042")
+
+    def test_no_plate_or_already_named_is_unchanged(self):
+        self.assertEqual(trip_name_for_plate("TRIP-0000000000042", None), "TRIP-0000000000042")
+        self.assertEqual(trip_name_for_plate("TRIP-ABC123-0000000000042", "ABC123"), "TRIP-ABC123-0000000000042")
+
+    def test_inserted_and_placeholder_trips_are_named_alike(self):
+        handler = ResponseProcessingHandler()
+        trip_doc = MagicMock()
+
+        def set_new_name(doc):
+            doc.name = "TRIP-0000000000042"
+
+        with patch.object(frappe, "get_doc", return_value=trip_doc), \
+                patch.object(response_handler, "set_new_name", side_effect=set_new_name):
+            inserted = handler._insert_trip(MagicMock(employee="EMP-1"), "Driver", {"truck_number": "T1"}, TRUCKS)
+
+        with patch.object(frappe, "rename_doc") as rename_doc:
+            renamed = handler._rename_trip_doc("TRIP-0000000000042", "ABC-123-GP")
+
+        self.assertEqual(inserted, "TRIP-ABC-123-GP-0000000000042")
+        self.assertEqual(renamed, inserted)
+        rename_doc.assert_called_once_with("Trip", "TRIP-0000000000042", inserted, force=True)
+        trip_doc.insert.assert_called_once_with(ignore_permissions=True, set_name=inserted)
+
+    def test_trip_is_inserted_once_under_its_final_name(self):
+        handler = ResponseProcessingHandler()
+        trip_doc = MagicMock()
+
+        def set_new_name(doc):
+            doc.name = "TRIP-0000000000043"
+
+        with patch.object(frappe, "get_doc", return_value=trip_doc), \
+                patch.object(frappe, "rename_doc") as rename_doc, \
+                patch.object(response_handler, "set_new_name", side_effect=set_new_name):
+            name = handler._insert_trip(MagicMock(employee="EMP-1"), "Driver", {"truck_number": "UNKNOWN", "odo_start": "120"}, TRUCKS)
+
+        self.assertEqual(name, "TRIP-0000000000043")
+        self.assertEqual(trip_doc.status, "Awaiting Approval")
+        trip_doc.set.assert_any_call("odo_start", 120)
+        trip_doc.insert.assert_called_once_with(ignore_permissions=True, set_name=name)
+        trip_doc.save.assert_not_called()
+        rename_doc.assert_not_called()
+
+class TestTripBatch(FrappeTestCase):
+    def _request(self, trip_id=None):
+        return SimpleNamespace(doc=MagicMock(employee="EMP-1"), trip_id=trip_id, trip_ids=[])
+
+    def _create(self, request, transactions, insert_trip):
+        handler = ResponseProcessingHandler()
+        with patch.object(frappe, "get_value", return_value="Driver"), \
+                patch.object(frappe, "db") as db, \
+                patch.object(handler, "_find_matching_trucks", return_value=TRUCKS), \
+                patch.object(handler, "_insert_trip", side_effect=insert_trip) as inserted:
+            try:
+                handler._create_trips(request, transactions)
+            finally:
+                self.db, self.inserted = db, inserted
+
+    def test_trips_commit_together(self):
+        request = self._request()
+        transactions = [{"truck_number": "T1", "delivery_note_number": 7}, {"delivery_note_number": 8}]
+
+        self._create(request, transactions, ["TRIP-ABC-123-GP-0000000000001", "TRIP-0000000000002"])
+
+        self.assertEqual(request.trip_ids, ["TRIP-ABC-123-GP-0000000000001", "TRIP-0000000000002"])
+        self.assertEqual(request.trip_id, "TRIP-ABC-123-GP-0000000000001")
+        request.doc.db_set.assert_called_once_with({"trip_count": 2, "delivery_note_number": "7, 8"}, update_modified=False)
+        self.db.commit.assert_called_once_with()
+        self.db.rollback.assert_not_called()
+
+    def test_failed_transaction_rolls_back_the_whole_batch(self):
+        request = self._request()
+        transactions = [{"truck_number": "T1"}, {"truck_number": "T2"}, {"truck_number": "T3"}]
+        failure = DocumentProcessingError("Failed to create trip: duplicate name")
+
+        with self.assertRaises(DocumentProcessingError):
+            self._create(request, transactions, ["TRIP-0000000000001", failure, "TRIP-0000000000003"])
+
+        # The third transaction is never attempted and nothing is committed
+        self.assertEqual(self.inserted.call_count, 2)
+        self.db.rollback.assert_called_once_with()
+        self.db.commit.assert_not_called()
+        request.doc.db_set.assert_not_called()
+        self.assertEqual(request.trip_ids, [])
+        self.assertIsNone(request.trip_id)
+
+    def test_placeholder_fills_the_first_transaction_only(self):
+        request = self._request(trip_id="TRIP-0000000000001")
+        placeholder = MagicMock()
+        handler_calls = []
+
+        def apply_transaction(trip_doc, transaction_data, trucks):
+            handler_calls.append(call(trip_doc, transaction_data))
+            return "TRIP-ABC-123-GP-0000000000001"
+
+        with patch.object(frappe, "get_doc", return_value=placeholder), \
+                patch.object(ResponseProcessingHandler, "_apply_transaction", side_effect=apply_transaction):
+            self._create(request, [{"truck_number": "T1"}, {}], ["TRIP-0000000000002"])
+
+        self.assertEqual(handler_calls, [call(placeholder, {"truck_number": "T1"})])
+        self.assertEqual(request.trip_ids, ["TRIP-ABC-123-GP-0000000000001", "TRIP-0000000000002"])
+        self.db.commit.assert_called_once_with()
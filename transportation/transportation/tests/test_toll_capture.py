@@ -0,0 +1,157 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from transportation.transportation.doctype.toll_capture import toll_capture
+from transportation.transportation.doctype.toll_capture.page_classifier import EMPTY
+from transportation.transportation.doctype.toll_capture.toll_capture import TollCapture
+
+class CheckpointRow(SimpleNamespace):
+    """Toll Capture Page row that records what was written to it"""
+    def __init__(self, page_number, stage="Pending", **fields):
+        fields.setdefault("is_valid", 0)
+        super().__init__(page_number=page_number, stage=stage, writes=[], **fields)
+
+    def db_set(self, values, update_modified=True):
+        self.__dict__.update(values)
+        self.writes.append(values)
+
+def done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+def prepared_page(data_url=None, verdict=None, error=None):
+    if error:
+        return {"error": error}
+    return {"data_url": data_url, "verdict": verdict, "sections": [b"section"], "layout": None, "classify_error": None, "scores": None}
+
+class TollCaptureTestCase(FrappeTestCase):
+    def setUp(self):
+        self.doc = TollCapture({"doctype": "Toll Capture", "name": "TC-CHECKPOINT", "toll_document": "/files/tolls.pdf"})
+        self.doc.pages = []
+        self.doc.pages_processed = 0
+        self.doc.page_count = 0
+        for target, name, value in (
+            (frappe, "db", MagicMock()),
+            (toll_capture, "publish_progress", MagicMock()),
+            (self.doc, "db_set", MagicMock(side_effect=self._db_set))
+        ):
+            patcher = patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _db_set(self, field, value=None, update_modified=True):
+        setattr(self.doc, field, value)
+
+class TestPageRows(TollCaptureTestCase):
+    def test_rows_are_created_once_and_legacy_progress_counts_as_sectioned(self):
+        self.doc.pages = [CheckpointRow(1, "Sectioned"), CheckpointRow(3, "Error")]
+        self.doc.pages_processed = 2
+        inserted = []
+
+        def append(fieldname, values):
+            row = CheckpointRow(**values, db_insert=lambda: inserted.append(values["page_number"]))
+            self.doc.pages.append(row)
+            return row
+
+        with patch.object(self.doc, "append", side_effect=append):
+            rows = self.doc._page_rows(4)
+
+        self.assertEqual([(row.page_number, row.stage) for row in rows], [(1, "Sectioned"), (2, "Sectioned"), (3, "Error"), (4, "Pending")])
+        self.assertEqual(inserted, [2, 4])
+        frappe.db.commit.assert_called_once_with()
+
+class TestResume(TollCaptureTestCase):
+    def _process(self, rows):
+        self.doc.pages = rows
+        resumed = []
+
+        def prepare_pages(encoder, remaining, mode):
+            resumed.extend(row.page_number for row in remaining)
+            return []
+
+        with patch.object(frappe, "get_site_path", return_value="/tmp/tolls.pdf"), \
+                patch.object(frappe, "get_single", return_value=frappe._dict(page_classification="Model Only")), \
+                patch.object(toll_capture.fitz, "open", return_value=MagicMock(__enter__=lambda self: [None] * len(rows))), \
+                patch.object(toll_capture, "PageEncoder", MagicMock()), \
+                patch.object(toll_capture, "get_layouts", return_value={}), \
+                patch.object(self.doc, "_next_result_number", return_value=1), \
+                patch.object(self.doc, "_prepare_pages", side_effect=prepare_pages), \
+                patch.object(self.doc, "_classify_pages", side_effect=lambda pages: iter(pages)), \
+                patch.object(self.doc, "save"):
+            self.doc.process_document()
+        return resumed
+
+    def test_finished_pages_are_not_processed_again(self):
+        rows = [CheckpointRow(1, "Sectioned"), CheckpointRow(2, "Skipped"), CheckpointRow(3, "Classified"), CheckpointRow(4, "Error"), CheckpointRow(5)]
+        self.assertEqual(self._process(rows), [3, 4, 5])
+
+    def test_status_reflects_failed_pages(self):
+        self._process([CheckpointRow(1, "Sectioned"), CheckpointRow(2, "Error")])
+        self.assertEqual(self.doc.status, "Error")
+
+        self._process([CheckpointRow(1, "Sectioned"), CheckpointRow(2, "Skipped")])
+        self.assertEqual(self.doc.status, "Processed")
+
+class TestPreparePages(TollCaptureTestCase):
+    def _prepare_calls(self, mode):
+        encoder = MagicMock(workers=1, layouts={})
+        encoder.prepare.side_effect = lambda *args: done(prepared_page())
+        list(self.doc._prepare_pages(encoder, [CheckpointRow(1, "Classified"), CheckpointRow(2)], mode))
+        return [call.args for call in encoder.prepare.call_args_list]
+
+    def test_classified_pages_are_not_classified_again(self):
+        self.assertEqual(self._prepare_calls("Local Then Model"), [(0, False, False), (1, True, True)])
+        self.assertEqual(self._prepare_calls("Model Only"), [(0, False, False), (1, False, True)])
+        self.assertEqual(self._prepare_calls("Local Only"), [(0, False, False), (1, True, False)])
+
+class TestClassifyPages(TollCaptureTestCase):
+    def test_verdicts_are_checkpointed_in_page_order(self):
+        rows = [CheckpointRow(1, "Classified", is_valid=1), CheckpointRow(2), CheckpointRow(3), CheckpointRow(4)]
+        pages = [prepared_page(), prepared_page(data_url="data:image/jpeg;base64,"), prepared_page(verdict=EMPTY), prepared_page(error="render failed")]
+
+        with patch.object(frappe, "get_single", return_value=frappe._dict(max_concurrent_requests=2)), \
+                patch.object(self.doc, "_validity_request_context", return_value={}), \
+                patch.object(self.doc, "_check_page_validity", return_value=(False, None)) as model_check, \
+                patch.object(toll_capture.transport, "RateLimitGate"), \
+                patch.object(toll_capture.transport, "reserve_connections"), \
+                patch.object(frappe, "log_error"):
+            results = list(self.doc._classify_pages(zip(rows, pages)))
+
+        self.assertEqual([(row.page_number, is_valid) for row, _, is_valid in results], [(1, True), (2, False), (3, False), (4, False)])
+        self.assertEqual(model_check.call_count, 1)
+        # A recorded verdict is reused without being written again
+        self.assertEqual(rows[0].writes, [])
+        self.assertEqual((rows[1].stage, rows[1].classified_by), ("Skipped", "model"))
+        self.assertEqual((rows[2].stage, rows[2].classified_by), ("Skipped", "local"))
+        self.assertEqual(rows[3].stage, "Error")
+        self.assertIn("render failed", rows[3].error)
+
+class TestSavePage(TollCaptureTestCase):
+    def test_sections_are_saved_with_the_checkpoint(self):
+        row = CheckpointRow(2, "Classified")
+        self.doc.pages = [row]
+
+        with patch.object(self.doc, "_insert_page_result") as insert:
+            next_number = self.doc._save_page(row, [b"one", b"two"], 7, "jpg")
+
+        self.assertEqual(next_number, 9)
+        self.assertEqual([call.args[1:3] for call in insert.call_args_list], [(7, 1), (8, 1)])
+        self.assertEqual((row.stage, row.sections), ("Sectioned", 2))
+        self.assertEqual(self.doc.pages_processed, 1)
+        frappe.db.commit.assert_called()
+
+    def test_failed_insert_rolls_back_and_marks_the_page(self):
+        row = CheckpointRow(2, "Classified")
+        self.doc.pages = [row]
+
+        with patch.object(self.doc, "_insert_page_result", side_effect=[None, Exception("disk full")]), \
+                patch.object(frappe, "log_error"):
+            self.doc._save_page(row, [b"one", b"two"], 7, "jpg")
+
+        frappe.db.rollback.assert_called_once_with()
+        self.assertEqual(row.stage, "Error")
+        self.assertIn("disk full", row.error)
+        self.assertEqual(self.doc.pages_processed, 0)
@@ -0,0 +1,96 @@
+from datetime import datetime
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from transportation.transportation.ai_processing.utils.tracing import Tracer
+
+class TracerTestCase(FrappeTestCase):
+    settings = {}
+
+    def setUp(self):
+        self.tracer = Tracer()
+        conf = patch.dict(frappe.local.conf, dict({"transportation_trace_sink": "memory"}, **self.settings))
+        conf.start()
+        self.addCleanup(conf.stop)
+
+    def events(self):
+        return [record["event"] for record in self.tracer.memory.records()]
+
+class TestLevels(TracerTestCase):
+    settings = {"transportation_trace_level": "warning"}
+
+    def test_records_below_the_level_are_dropped(self):
+        self.tracer.debug("a")
+        self.tracer.info("b")
+        self.tracer.warning("c")
+        self.tracer.error("d")
+        self.assertEqual(self.events(), ["c", "d"])
+
+    def test_record_fields(self):
+        with self.tracer.trace("DNC-0001"):
+            self.tracer.warning("image.preprocessed", pages=2)
+
+        record, = self.tracer.memory.records()
+        self.assertEqual(record["trace_id"], "DNC-0001")
+        self.assertEqual(record["pages"], 2)
+        self.assertEqual(record["level"], "warning")
+        self.assertIsNotNone(datetime.fromisoformat(record["ts"]).tzinfo)
+
+class TestSampling(TracerTestCase):
+    settings = {"transportation_trace_sample_rate": 0.5}
+
+    def test_a_trace_keeps_or_drops_all_its_records(self):
+        for kept in (True, False):
+            self.tracer.memory.clear()
+            with patch("random.random", return_value=0.2 if kept else 0.8), self.tracer.trace("DNC-0001"):
+                for _ in range(5):
+                    self.tracer.info("step")
+            self.assertEqual(len(self.tracer.memory.records()), 5 if kept else 0)
+
+    def test_errors_are_written_when_not_sampled(self):
+        with patch("random.random", return_value=0.8), self.tracer.trace("DNC-0001"):
+            self.tracer.info("dropped")
+            self.tracer.error("failed")
+        self.assertEqual(self.events(), ["failed"])
+
+    def test_context_is_restored_after_a_trace(self):
+        with patch("random.random", return_value=0.8), self.tracer.trace("outer"):
+            with patch("random.random", return_value=0.2), self.tracer.trace("inner"):
+                self.tracer.info("kept")
+            self.tracer.info("dropped")
+        self.assertEqual([record["trace_id"] for record in self.tracer.memory.records()], ["inner"])
+
+class TestSpans(TracerTestCase):
+    def test_span_records_duration_and_extra_fields(self):
+        with self.tracer.span("provider.call", model="gpt-4o") as extra:
+            extra["tokens"] = 12
+
+        record, = self.tracer.memory.records()
+        self.assertEqual((record["outcome"], record["model"], record["tokens"]), ("ok", "gpt-4o", 12))
+        self.assertGreaterEqual(record["duration_ms"], 0)
+
+    def test_failed_span_is_an_error_record(self):
+        with self.assertRaises(ValueError), self.tracer.span("provider.call", level="debug"):
+            raise ValueError("timeout")
+
+        record, = self.tracer.memory.records()
+        self.assertEqual((record["level"], record["outcome"], record["error"]), ("error", "error", "timeout"))
+
+class TestSinks(FrappeTestCase):
+    def _emit(self, sink):
+        tracer = Tracer()
+        with patch.dict(frappe.local.conf, {"transportation_trace_sink": sink}), \
+                patch.object(tracer.file, "write") as file_write:
+            tracer.info("event")
+        return len(tracer.memory.records()), file_write.call_count
+
+    def test_sink_selection(self):
+        self.assertEqual(self._emit("file"), (0, 1))
+        self.assertEqual(self._emit("memory"), (1, 0))
+        self.assertEqual(self._emit("both"), (1, 1))
+
+    def test_file_sink_writes_json_lines(self):
+        tracer = Tracer()
+        with patch.object(frappe, "logger") as logger:
+            tracer.file.write({"event": "event", "ts": datetime(2026, 1, 1)})
+        logger.return_value.info.assert_called_once_with('{"event": "event", "ts": "2026-01-01 00:00:00"}')
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from transportation.transportation.ai_processing.providers import transport
+from transportation.transportation.ai_processing.providers.rate_limiter import LocalRateLimiter
+from .provider_stub import ProviderStub
+
+class TestTransport(FrappeTestCase):
+    def test_base_url_points_at_the_stub(self):
+        with ProviderStub() as stub, patch.dict(frappe.local.conf, {"ai_provider_stub_url": stub.url + "/"}):
+            self.assertEqual(transport.get_base_url(frappe._dict(base_url="https://api.openai.com/v1")), stub.url)
+
+    def test_connections_outlive_the_thread_pools_that_use_them(self):
+        transport.reserve_connections(4)
+        with ProviderStub({"ok": True}) as stub:
+            for _ in range(3):
+                # A fresh pool per document, as the AI handler and toll capture create them
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    responses = list(executor.map(
+                        lambda index: transport.post_json(f"{stub.url}/chat/completions", {}, {"index": index}, timeout=10),
+                        range(8)
+                    ))
+                self.assertTrue(all(response.json() == {"ok": True} for response in responses))
+
+        self.assertEqual(len(stub.requests), 24)
+        self.assertLessEqual(len(stub.client_ports), 4)
+
+    def test_limiter_is_settled_from_reported_usage(self):
+        limiter = LocalRateLimiter(frappe.generate_hash(length=16), 0, 10000)
+        with ProviderStub({"usage": {"total_tokens": 50}}) as stub:
+            transport.post_json(f"{stub.url}/messages", {}, {"max_tokens": 1000}, timeout=10, limiter=limiter)
+
+        # 1000 tokens were taken up front; the 950 not used are given back
+        self.assertAlmostEqual(limiter._state["tokens"], 10000 - 50, delta=5)